@@ -1,7 +1,9 @@
 from .dataset import Dataset
 from .dataset_storage import DatasetStorage
+from .dataset_loader import DatasetLoader
 
 __all__ = [
     "Dataset",
     "DatasetStorage",
+    "DatasetLoader",
 ]
@@ -1,16 +1,24 @@
 import sqlite3
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Iterable, Iterator
 
+from libs.util.database import get_connection
+from libs.util.json_util import decode_json, encode_json
 from libs.util.secret import DEFAULT_DATABASE_PATH
 
+ENTRY_COLUMNS = "id, input_variables, reference_output, metadata"
+
+
 # TODO: 추후 데이터셋 버저닝할수 있도록 개선
 class Dataset:
 
     def __init__(self, dataset_id: int, database: str = DEFAULT_DATABASE_PATH):
         self.database = database
-        self.conn = sqlite3.connect(self.database)
         self.dataset_id = dataset_id
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
     def add_entry(
             self,
             input_variables: Dict[str, Any],
@@ -22,26 +30,90 @@ class Dataset:
             INSERT INTO data (dataset_id, input_variables, reference_output, metadata)
             VALUES (?, ?, ?, ?)
         ''', (self.dataset_id,
-              str(input_variables),
+              encode_json(input_variables),
               reference_output,
-              str(metadata) if metadata else None))
+              encode_json(metadata) if metadata else None))
         self.conn.commit()
 
+    def add_entries(self, entries: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """ 여러 엔트리를 하나의 트랜잭션으로 batch_size 개씩 executemany 로 추가하고, 추가한 개수를 반환한다.
+
+        entries 는 get_entries 와 같은 형식(input_variables, reference_output, metadata 키)의 dict 를 받는다.
+        """
+        cursor = self.conn.cursor()
+        count = 0
+        batch = []
+        try:
+            for entry in entries:
+                metadata = entry.get("metadata")
+                batch.append((self.dataset_id,
+                              encode_json(entry["input_variables"]),
+                              entry.get("reference_output"),
+                              encode_json(metadata) if metadata else None))
+                if len(batch) >= batch_size:
+                    count += self._insert_batch(cursor, batch)
+                    batch = []
+            if batch:
+                count += self._insert_batch(cursor, batch)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return count
+
+    @staticmethod
+    def _insert_batch(cursor: sqlite3.Cursor, batch: List[tuple]) -> int:
+        cursor.executemany('''
+            INSERT INTO data (dataset_id, input_variables, reference_output, metadata)
+            VALUES (?, ?, ?, ?)
+        ''', batch)
+        return len(batch)
+
     def get_entries(self) -> List[Dict[str, Any]]:
+        return list(self.iter_entries())
+
+    def iter_entries(self, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ 전체 엔트리를 chunk_size 개씩 읽어오며 하나씩 반환한다. """
         cursor = self.conn.cursor()
         cursor.execute(
-            "SELECT input_variables, reference_output, metadata FROM data WHERE dataset_id = ?",
+            f"SELECT {ENTRY_COLUMNS} FROM data WHERE dataset_id = ? ORDER BY id",
             (self.dataset_id,)
         )
-        rows = cursor.fetchall()
-        return [
-            {
-                "input_variables": eval(row[0]),
-                "reference_output": row[1],
-                "metadata": eval(row[2]) if row[2] else None
-            }
-            for row in rows
-        ]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._to_entry(row)
+
+    def get_entries_page(self, limit: int = 100, offset: int = 0, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ limit/offset 페이지 조회. after_id 를 주면 해당 id 다음부터 읽는 keyset 방식으로 조회한다. """
+        cursor = self.conn.cursor()
+        if after_id is not None:
+            cursor.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM data WHERE dataset_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (self.dataset_id, after_id, limit)
+            )
+        else:
+            cursor.execute(
+                f"SELECT {ENTRY_COLUMNS} FROM data WHERE dataset_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                (self.dataset_id, limit, offset)
+            )
+        return [self._to_entry(row) for row in cursor.fetchall()]
+
+    def count_entries(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM data WHERE dataset_id = ?", (self.dataset_id,))
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def _to_entry(row) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "input_variables": decode_json(row[1]),
+            "reference_output": row[2],
+            "metadata": decode_json(row[3]) if row[3] else None
+        }
 
     def delete_entry(self, entry_id: int):
         cursor = self.conn.cursor()
@@ -0,0 +1,122 @@
+import csv
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from libs.dataset.dataset import Dataset
+
+
+class DatasetLoader:
+    """ CSV/JSONL/Parquet 파일을 한 줄씩 읽어 데이터셋 엔트리로 변환하고 Dataset.add_entries 로 적재한다.
+
+    파일 전체를 메모리에 올리지 않으므로 파일 크기와 관계없이 사용하는 메모리가 일정하다.
+    """
+
+    def __init__(self,
+                 input_columns: Union[List[str], Dict[str, str]],
+                 reference_column: Optional[str] = None,
+                 metadata_columns: Optional[Union[List[str], Dict[str, str]]] = None):
+        # {컬럼 이름: input_variables 키} 형태로 정규화, 리스트로 주면 컬럼 이름을 그대로 키로 사용
+        self.input_columns = self._to_mapping(input_columns)
+        self.reference_column = reference_column
+        self.metadata_columns = self._to_mapping(metadata_columns or [])
+
+    @staticmethod
+    def _to_mapping(columns: Union[List[str], Dict[str, str]]) -> Dict[str, str]:
+        if isinstance(columns, dict):
+            return dict(columns)
+        return {column: column for column in columns}
+
+    def load(self, dataset: Dataset, path: str, file_format: Optional[str] = None, batch_size: int = 1000) -> int:
+        return dataset.add_entries(self.iter_entries(path, file_format), batch_size=batch_size)
+
+    def iter_entries(self, path: str, file_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        path = os.path.expanduser(path)
+        file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+
+        if file_format == "csv":
+            rows = self._iter_csv(path)
+        elif file_format in ("jsonl", "ndjson"):
+            rows = self._iter_jsonl(path)
+        elif file_format == "parquet":
+            rows = self._iter_parquet(path)
+        else:
+            raise ValueError(f"Unsupported file format: {file_format}")
+
+        for row in rows:
+            yield self._to_entry(row)
+
+    def _to_entry(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        missing = [column for column in self.input_columns if column not in row]
+        if missing:
+            raise ValueError(f"Columns {missing} do not exist in the source file.")
+
+        reference_output = row.get(self.reference_column) if self.reference_column else None
+        return {
+            "input_variables": {key: row[column] for column, key in self.input_columns.items()},
+            "reference_output": str(reference_output) if reference_output is not None else None,
+            "metadata": {key: row.get(column) for column, key in self.metadata_columns.items()} or None,
+        }
+
+    @staticmethod
+    def _iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+        # utf-8-sig: 엑셀에서 저장한 CSV 의 BOM 제거
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+
+    @staticmethod
+    def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def _iter_parquet(path: str, batch_size: int = 10_000) -> Iterator[Dict[str, Any]]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to load parquet files. Install it with `pip install pyarrow`.")
+
+        parquet_file = pq.ParquetFile(path)
+        for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield from record_batch.to_pylist()
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    from libs.dataset.dataset_storage import DatasetStorage
+
+    # 고객 문의 CSV 를 반복해서 큰 파일을 만든 뒤, 행 단위 add_entry 와 add_entries 의 적재 속도를 비교
+    source_path = os.path.join(os.path.dirname(__file__), "../../dataset/customer_inquiries.csv")
+    with open(source_path, encoding="utf-8") as f:
+        header, *lines = f.read().splitlines()
+
+    num_rows = 20_000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "customer_inquiries.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(header + "\n")
+            for i in range(num_rows):
+                f.write(lines[i % len(lines)] + "\n")
+
+        loader = DatasetLoader(input_columns={"문의": "text"}, reference_column="카테고리")
+        storage = DatasetStorage(database=os.path.join(tmp_dir, "benchmark.db"))
+
+        storage.create_dataset("per_row")
+        dataset = storage.get_dataset("per_row")
+        start_time = time.perf_counter()
+        for entry in loader.iter_entries(csv_path):
+            dataset.add_entry(entry["input_variables"], entry["reference_output"], entry["metadata"])
+        per_row_elapsed = time.perf_counter() - start_time
+
+        storage.create_dataset("bulk")
+        dataset = storage.get_dataset("bulk")
+        start_time = time.perf_counter()
+        count = loader.load(dataset, csv_path)
+        bulk_elapsed = time.perf_counter() - start_time
+
+        print(f"add_entry    : {num_rows / per_row_elapsed:,.0f} rows/sec ({per_row_elapsed:.2f}s)")
+        print(f"add_entries  : {count / bulk_elapsed:,.0f} rows/sec ({bulk_elapsed:.2f}s)")
@@ -2,6 +2,7 @@ import sqlite3
 from typing import List
 
 from libs.dataset import Dataset
+from libs.util.database import get_connection
 from libs.util.secret import DEFAULT_DATABASE_PATH
 
 
@@ -9,32 +10,10 @@ class DatasetStorage:
 
     def __init__(self, database: str = DEFAULT_DATABASE_PATH):
         self.database = database
-        self.conn = sqlite3.connect(self.database)
-        self._initialize_db()
 
-    def _initialize_db(self):
-        cursor = self.conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS datasets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
-                NAME TEXT UNIQUE NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                dataset_id INTEGER NOT NULL,
-                TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
-                input_variables TEXT NOT NULL,
-                reference_output TEXT,
-                metadata TEXT,
-                FOREIGN KEY (dataset_id) REFERENCES datasets(id) ON DELETE CASCADE
-            )
-        ''')
-        self.conn.commit()
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
 
     def create_dataset(self, name: str):
         cursor = self.conn.cursor()
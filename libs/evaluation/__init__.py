@@ -1,5 +1,12 @@
 from .evaluation import Evaluation
+from .evaluation_history import EvaluationHistory
+from .metrics import MetricsAccumulator, QuantileSketch
+from .rollup import EvaluationRollup
 
 __all__ = [
     "Evaluation",
+    "EvaluationHistory",
+    "EvaluationRollup",
+    "MetricsAccumulator",
+    "QuantileSketch",
 ]
@@ -1,81 +1,115 @@
+import asyncio
 import os
 import sqlite3
-from typing import Dict, List, Any, Tuple
+from contextlib import contextmanager
+from enum import Enum
+from typing import Callable, Dict, List, Any, Tuple, Union
 
-import pandas as pd
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.runnables.base import Runnable
-from langchain_ollama import ChatOllama
 from langchain_pinecone import PineconeEmbeddings
 
-from libs.evaluator import EvaluatorType, create_evaluator
+from libs.evaluation.metrics import MetricsAccumulator
+from libs.evaluation.rollup import EvaluationRollup
+from libs.evaluator import EvaluatorType, MultiEvaluator, create_evaluator
+from libs.model import ChatModelManager
+from libs.model.response_cache import ResponseCache
+from libs.util.database import get_connection
+from libs.util.embedding_cache import EmbeddingCache
+from libs.util.json_util import decode_json, encode_json
 from libs.util.secret import DEFAULT_DATABASE_PATH
+from libs.util.tracing import Tracer, span
+
+# evaluation_details 의 고정 컬럼으로 저장되는 결과 키, 나머지 키는 metadata 컬럼에 저장된다.
+RESULT_COLUMNS = ["input_variables", "output", "reference_output", "input_token", "output_token", "latency", "score", "scores",
+                  "ttft", "tokens_per_second", "itl_p50", "itl_p99"]
+# 스트리밍으로 생성했을 때만 값이 있는 결과 컬럼
+STREAMING_COLUMNS = ["ttft", "tokens_per_second", "itl_p50", "itl_p99"]
+# 재채점할 때 원래 평가의 상세 metadata 에서 가져오는 생성 결과 키 (채점 결과 키는 버린다)
+GENERATION_METADATA_KEYS = ["cached"]
+# 재채점 평가의 metadata 로 옮기지 않는 원래 평가의 실행 정보
+RUN_METADATA_KEYS = ["cache_hits", "judge_usage", "trace"]
+
+
+class EvaluationStatus(Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
 
 
 class Evaluation:
     def __init__(self,
                  chain: Runnable,
-                 evaluation_type: EvaluatorType,
+                 evaluation_type: Union[EvaluatorType, List[EvaluatorType]],
                  dataset_entries: List[Tuple[Dict[str, str], str]],
                  metadata: Dict[str, Any] = None,
                  database: str = DEFAULT_DATABASE_PATH,
                  environment: Dict[str, str] = None,
-                 retriever: BaseRetriever = None):
+                 retriever: BaseRetriever = None,
+                 max_concurrency: int = 1,
+                 response_cache: ResponseCache = None,
+                 judge_concurrency: int = None,
+                 judge_pack_size: int = 1,
+                 persist_batch_size: int = 50,
+                 measure_streaming: bool = False,
+                 trace_dir: str = None,
+                 progress_callback: Callable[[Dict[str, Any]], None] = None):
         self.database = database
-        self.conn = sqlite3.connect(self.database)
-        self._initialize_db()
 
         self.chain = chain
         self.retriever = retriever
-        self.evaluation_type = evaluation_type
+        # 평가자를 여러 개 주면 출력은 한 번만 생성하고 모든 평가자가 채점한다. 대표 점수(score)는 첫 번째 평가자 기준
+        evaluation_types = evaluation_type if isinstance(evaluation_type, list) else [evaluation_type]
+        self.evaluation_types = list(dict.fromkeys(evaluation_types))
+        self.evaluation_type = self.evaluation_types[0]
         self.dataset_entries = dataset_entries
         self.metadata = metadata or {}
+        self.max_concurrency = max(1, max_concurrency)
+        self.response_cache = response_cache
+        # 파이프라인 채점(LLM judge 등)에서 동시에 수행할 채점 호출 수
+        self.judge_concurrency = max(1, judge_concurrency or self.max_concurrency)
+        # LLM judge 한 번의 요청에 묶어서 평가할 항목 수
+        self.judge_pack_size = max(1, judge_pack_size)
+        # 결과를 evaluation_details 에 나누어 저장하는 단위
+        self.persist_batch_size = max(1, persist_batch_size)
+        # 스트리밍으로 생성해서 TTFT, 초당 출력 토큰 수, 토큰 간 지연 시간을 측정한다. (Ollama 와 Claude 의 응답 속도 비교용)
+        self.measure_streaming = measure_streaming
+        if measure_streaming:
+            self.metadata["measure_streaming"] = True
+        # 있으면 단계별 span 을 기록해서 trace_dir 에 JSONL 과 Chrome trace 파일로 저장한다.
+        self.trace_dir = trace_dir
+        self.tracer = None
+        # 결과가 하나 나올 때마다 MetricsAccumulator.snapshot() 으로 호출된다.
+        self.progress_callback = progress_callback
 
         if environment:
             os.environ.update(environment)
 
         self._set_chain_metadata()
 
+        self.evaluation_id = None
+        # 재채점 평가이면 원래 평가 ID 와 원래 평가의 생성 결과
+        self.parent_evaluation_id = None
+        self._stored_results = None
         self.results = None
+        self._unsaved_results = []
+        self.metrics = None
         self.token_usage = None
         self.latency = None
+        self.ttft = None
+        self.tokens_per_second = None
         self.score = None
+        self.scores = None
 
-    def _initialize_db(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS evaluations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
-                evaluation_type TEXT NOT NULL,
-                metadata TEXT,
-                token_usage TEXT NOT NULL,
-                latency TEXT NOT NULL,
-                score REAL NOT NULL
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS evaluation_details (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                evaluation_id INTEGER NOT NULL,
-                TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
-                input_variables TEXT NOT NULL,
-                OUTPUT TEXT NOT NULL,
-                reference_output TEXT,
-                input_token INTEGER,
-                output_token INTEGER,
-                latency REAL,
-                metadata TEXT,
-                score REAL NOT NULL,
-                FOREIGN KEY (evaluation_id) REFERENCES evaluations(id) ON DELETE CASCADE
-            )
-        ''')
-        self.conn.commit()
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
 
     def _set_chain_metadata(self):
+        if self.chain is None:
+            return
         for step in self.chain.steps:
             if isinstance(step, ChatPromptTemplate):
                 self.metadata["prompt_template"] = [m.prompt.template for m in step.messages]
@@ -88,86 +122,540 @@ class Evaluation:
                 elif hasattr(step, "max_tokens"):
                     self.metadata["max_tokens"] = step.max_tokens
 
-    # TODO: 추후 비동기 수행 가능하도록 수정 필요
-    def run_evaluation(self):
+    def run_evaluation(self, resume_evaluation_id: int = None):
+        """ resume_evaluation_id 를 주면 해당 평가에 이미 저장된 엔트리는 건너뛰고 나머지만 수행한다.
+
+        재개할 때는 처음 실행과 같은 순서의 dataset_entries 를 사용해야 한다.
+        """
+        with self._tracing():
+            evaluator = self._create_evaluator()
+            pending_entries = self._start_evaluation(resume_evaluation_id)
+
+            try:
+                if self.max_concurrency > 1 or (evaluator.pipelined_scoring and self.judge_concurrency > 1):
+                    self._run_async(self._aevaluate_entries(evaluator, pending_entries))
+                else:
+                    self._evaluate_entries(evaluator, pending_entries)
+            except BaseException:
+                # Streamlit rerun 등으로 중단되어도 지금까지의 결과는 남긴다.
+                self._fail_evaluation()
+                raise
+
+            return self._finish_evaluation(evaluator)
+
+    async def arun_evaluation(self, resume_evaluation_id: int = None):
+        # 이미 이벤트 루프가 실행 중인 환경(노트북 등)에서 사용
+        with self._tracing():
+            evaluator = self._create_evaluator()
+            pending_entries = self._start_evaluation(resume_evaluation_id)
+
+            try:
+                await self._aevaluate_entries(evaluator, pending_entries)
+            except BaseException:
+                self._fail_evaluation()
+                raise
+
+            return self._finish_evaluation(evaluator)
+
+    def resume_evaluation(self, evaluation_id: int):
+        return self.run_evaluation(resume_evaluation_id=evaluation_id)
+
+    @classmethod
+    def rescore(cls,
+                evaluation_id: int,
+                evaluation_types: List[EvaluatorType],
+                database: str = DEFAULT_DATABASE_PATH,
+                environment: Dict[str, str] = None,
+                judge_concurrency: int = 1,
+                judge_pack_size: int = 1,
+                persist_batch_size: int = 50,
+                progress_callback: Callable[[Dict[str, Any]], None] = None) -> List["Evaluation"]:
+        """ 저장된 evaluation_details 의 출력을 평가자별로 다시 채점해 원래 평가에 연결된 새 평가로 저장한다.
+
+        체인은 호출하지 않으므로 채점 비용만 든다. 토큰 사용량과 지연 시간은 원래 생성 결과의 값을 그대로 사용한다.
+        """
+        metadata, stored_results = cls._load_stored_outputs(evaluation_id, database)
+
+        evaluations = []
+        for evaluation_type in evaluation_types:
+            evaluation = cls(
+                chain=None,
+                evaluation_type=evaluation_type,
+                dataset_entries=[(result["input_variables"], result["reference_output"]) for result in stored_results],
+                metadata=dict(metadata),
+                database=database,
+                environment=environment,
+                judge_concurrency=judge_concurrency,
+                judge_pack_size=judge_pack_size,
+                persist_batch_size=persist_batch_size,
+                progress_callback=progress_callback,
+            )
+            evaluation.parent_evaluation_id = evaluation_id
+            evaluation._stored_results = stored_results
+            evaluation.run_rescoring()
+            evaluations.append(evaluation)
+        return evaluations
+
+    def run_rescoring(self, resume_evaluation_id: int = None):
+        """ 원래 평가의 생성 결과를 다시 채점한다. rescore() 밖에서 호출하면 parent_evaluation_id (재개할 때는 재개할 평가의
+        parent_evaluation_id) 의 저장된 출력을 불러와서 사용한다.
+
+        예) 중단된 재채점 재개: Evaluation(None, EvaluatorType.LLM_JUDGE, []).run_rescoring(resume_evaluation_id=evaluation_id)
+        """
+        if self._stored_results is None:
+            self._load_parent_outputs(resume_evaluation_id)
+
+        with self._tracing():
+            evaluator = self._create_evaluator()
+            pending_entries = self._start_evaluation(resume_evaluation_id)
+
+            try:
+                if self.judge_concurrency > 1:
+                    self._run_async(self._arescore_entries(evaluator, pending_entries))
+                else:
+                    self._rescore_entries(evaluator, pending_entries)
+            except BaseException:
+                self._fail_evaluation()
+                raise
+
+            return self._finish_evaluation(evaluator)
+
+    def _load_parent_outputs(self, resume_evaluation_id: int = None):
+        if self.parent_evaluation_id is None and resume_evaluation_id is not None:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT parent_evaluation_id FROM evaluations WHERE id = ?", (resume_evaluation_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Evaluation '{resume_evaluation_id}' does not exist.")
+            self.parent_evaluation_id = row[0]
+        if self.parent_evaluation_id is None:
+            raise ValueError("Re-scoring needs parent_evaluation_id or a re-scoring evaluation to resume.")
+
+        metadata, self._stored_results = self._load_stored_outputs(self.parent_evaluation_id, self.database)
+        # 재개할 때 저장된 결과의 entry_index 가 원래 평가의 순서와 맞도록 원래 평가의 엔트리를 그대로 사용한다.
+        self.dataset_entries = [(result["input_variables"], result["reference_output"]) for result in self._stored_results]
+        self.metadata = {**metadata, **self.metadata}
+
+    @staticmethod
+    def _run_async(coroutine):
+        """ 새 이벤트 루프에서 실행하고, 루프가 닫히기 전에 그 루프에서 만든 모델 HTTP 클라이언트를 닫는다. """
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await ChatModelManager.aclose_loop_clients()
+        return asyncio.run(run())
+
+    @contextmanager
+    def _tracing(self):
+        """ trace_dir 가 있으면 실행 중의 span 을 기록하고, 끝나면(실패 포함) 파일로 내보내고 단계별 시간을 metadata 에 남긴다. """
+        if self.trace_dir is None:
+            yield
+            return
+
+        self.tracer = Tracer()
+        try:
+            with self.tracer.activate(), span("evaluation", evaluation_types=[t.value for t in self.evaluation_types]):
+                yield
+        finally:
+            self._save_trace()
+
+    def _save_trace(self):
+        if self.evaluation_id is None:
+            return
+        self.tracer.trace_id = self.evaluation_id
+        base_path = os.path.join(self.trace_dir, f"evaluation_{self.evaluation_id}")
+        self.metadata["trace"] = {
+            "jsonl": self.tracer.export_jsonl(base_path + ".jsonl"),
+            "chrome": self.tracer.export_chrome_trace(base_path + ".trace.json"),
+            "stages": self.tracer.stage_breakdown(),
+        }
+        self.conn.execute("UPDATE evaluations SET metadata = ? WHERE id = ?", (encode_json(self.metadata), self.evaluation_id))
+        self.conn.commit()
+
+    @staticmethod
+    def _load_stored_outputs(evaluation_id: int, database: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        cursor = get_connection(database).cursor()
+        cursor.execute("SELECT metadata FROM evaluations WHERE id = ?", (evaluation_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"Evaluation '{evaluation_id}' does not exist.")
+        metadata = {k: v for k, v in (decode_json(row[0]) or {}).items() if k not in RUN_METADATA_KEYS}
+
+        cursor.execute('''
+            SELECT input_variables, OUTPUT, reference_output, input_token, output_token, latency, metadata,
+                   ttft, tokens_per_second, itl_p50, itl_p99
+            FROM evaluation_details
+            WHERE evaluation_id = ?
+            ORDER BY entry_index, id
+        ''', (evaluation_id,))
+
+        stored_results = []
+        for row in cursor.fetchall():
+            result = {
+                "input_variables": decode_json(row[0]),
+                "output": row[1],
+                "reference_output": row[2],
+                "input_token": row[3],
+                "output_token": row[4],
+                "latency": row[5],
+            }
+            result.update({column: value for column, value in zip(STREAMING_COLUMNS, row[7:]) if value is not None})
+            detail_metadata = decode_json(row[6]) or {}
+            result.update({k: v for k, v in detail_metadata.items() if k in GENERATION_METADATA_KEYS})
+            stored_results.append(result)
+        return metadata, stored_results
+
+    def _create_evaluator(self):
+        evaluators = [self._create_single_evaluator(evaluation_type) for evaluation_type in self.evaluation_types]
+        if len(evaluators) == 1:
+            return evaluators[0]
+        return MultiEvaluator(chain=self.chain, evaluators=evaluators, response_cache=self.response_cache,
+                              measure_streaming=self.measure_streaming)
+
+    def _create_single_evaluator(self, evaluation_type: EvaluatorType):
         embedding_model = None
+        embedding_cache = None
         judge_model = None
 
-        if self.evaluation_type == EvaluatorType.EMBEDDING_DISTANCE:
+        if evaluation_type == EvaluatorType.EMBEDDING_DISTANCE:
             embedding_model = PineconeEmbeddings(model="multilingual-e5-large")
-        if self.evaluation_type == EvaluatorType.LLM_JUDGE:
-            judge_model = ChatOllama(model="mistral", temperature=0.1, num_predict=256)
+            embedding_cache = EmbeddingCache(database=self.database)
+        if evaluation_type == EvaluatorType.LLM_JUDGE:
+            # ChatModelManager 로 만들어 평가 대상 모델과 같은 Ollama 서버의 호출 한도를 공유한다.
+            judge_model = ChatModelManager().get_model("mistral", temperature=0.1, max_tokens=256)
 
-        evaluator = create_evaluator(
-            evaluator_type=self.evaluation_type,
+        return create_evaluator(
+            evaluator_type=evaluation_type,
             chain=self.chain,
             judge_model=judge_model,
             embedding_model=embedding_model,
+            response_cache=self.response_cache,
+            embedding_cache=embedding_cache,
+            judge_pack_size=self.judge_pack_size,
+            measure_streaming=self.measure_streaming,
         )
 
-        results = []
+    def _evaluate_entries(self, evaluator, pending_entries: List[Tuple[int, Dict[str, str], str]]):
+        if evaluator.batch_scoring or evaluator.pack_size > 1:
+            # 일괄 채점도 persist_batch_size 단위로 나누어 수행해야 중간 결과가 저장된다.
+            for chunk in self._chunk(pending_entries):
+                results = []
+                for index, input_variables, reference_output in chunk:
+                    with span("entry", entry_index=index):
+                        results.append(evaluator.generate(input_variables=input_variables, reference_output=reference_output))
+                with span("score", entries=len(chunk)):
+                    scored = evaluator.score_batch(results)
+                for (index, _, _), result in zip(chunk, scored):
+                    self._record_result(index, result)
+        else:
+            for index, input_variables, reference_output in pending_entries:
+                with span("entry", entry_index=index):
+                    result = evaluator.evaluate(input_variables=input_variables, reference_output=reference_output)
+                self._record_result(index, result)
 
-        for input_variables, reference_output in self.dataset_entries:
-            result = evaluator.evaluate(input_variables=input_variables, reference_output=reference_output)
-            results.append(result)
+    async def _aevaluate_entries(self, evaluator, pending_entries: List[Tuple[int, Dict[str, str], str]]):
+        if evaluator.pipelined_scoring:
+            return await self._apipeline_entries(evaluator, pending_entries)
 
-        self.results = results
-        self._calculate_evaluation_metrics()
-        self._save_evaluation_results()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
 
-        return results
+        async def generate_entry(index, input_variables, reference_output):
+            async with semaphore, span("entry", entry_index=index):
+                return await evaluator.agenerate(input_variables=input_variables, reference_output=reference_output)
 
-    def _calculate_evaluation_metrics(self):
-        token_usages = [result["input_token"] + result["output_token"] for result in self.results]
-        latencies = [result["latency"] for result in self.results]
-        scores = [result["score"] for result in self.results]
-
-        self.token_usage = {
-            "25%": pd.Series(token_usages).quantile(0.25),
-            "50%": pd.Series(token_usages).quantile(0.50),
-            "75%": pd.Series(token_usages).quantile(0.75),
-            "99%": pd.Series(token_usages).quantile(0.99)
-        }
+        async def evaluate_entry(index, input_variables, reference_output):
+            async with semaphore, span("entry", entry_index=index):
+                result = await evaluator.aevaluate(input_variables=input_variables, reference_output=reference_output)
+            self._record_result(index, result)
 
-        self.latency = {
-            "25%": pd.Series(latencies).quantile(0.25),
-            "50%": pd.Series(latencies).quantile(0.50),
-            "75%": pd.Series(latencies).quantile(0.75),
-            "99%": pd.Series(latencies).quantile(0.99)
-        }
+        if evaluator.batch_scoring:
+            for chunk in self._chunk(pending_entries):
+                # gather 는 입력 순서대로 결과를 반환하므로 chunk 의 순서가 유지된다.
+                results = await asyncio.gather(*[
+                    generate_entry(index, input_variables, reference_output)
+                    for index, input_variables, reference_output in chunk
+                ])
+                async with span("score", entries=len(chunk)):
+                    scored = await evaluator.ascore_batch(results)
+                for (index, _, _), result in zip(chunk, scored):
+                    self._record_result(index, result)
+        else:
+            await asyncio.gather(*[
+                evaluate_entry(index, input_variables, reference_output)
+                for index, input_variables, reference_output in pending_entries
+            ])
 
-        self.score = sum(scores) / len(scores) if scores else 0
+    async def _apipeline_entries(self, evaluator, pending_entries: List[Tuple[int, Dict[str, str], str]]):
+        """ 생성 결과를 pack_size 개씩 큐로 넘겨 judge_concurrency 개의 채점 작업이 생성과 동시에 처리하도록 한다. """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 채점이 밀리면 생성도 잠시 멈추도록 큐 크기를 제한한다.
+        queue = asyncio.Queue(maxsize=self.judge_concurrency * 2)
+        pending = []
+        errors = []
 
-    def _save_evaluation_results(self):
+        async def generate_entry(index, input_variables, reference_output):
+            async with semaphore, span("entry", entry_index=index):
+                result = await evaluator.agenerate(input_variables=input_variables, reference_output=reference_output)
+            pending.append((index, result))
+            if len(pending) >= evaluator.pack_size:
+                pack = pending[:]
+                pending.clear()
+                await queue.put(pack)
+
+        async def score_worker():
+            while True:
+                pack = await queue.get()
+                try:
+                    async with span("score", entries=len(pack)):
+                        scored = await evaluator.ascore_batch([result for _, result in pack])
+                    for (index, _), result in zip(pack, scored):
+                        self._record_result(index, result)
+                except Exception as ex:
+                    errors.append(ex)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(score_worker()) for _ in range(self.judge_concurrency)]
+        try:
+            await asyncio.gather(*[
+                generate_entry(index, input_variables, reference_output)
+                for index, input_variables, reference_output in pending_entries
+            ])
+            if pending:
+                await queue.put(pending[:])
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        if errors:
+            raise errors[0]
+
+    def _rescore_entries(self, evaluator, pending_entries: List[Tuple[int, Dict[str, str], str]]):
+        for chunk in self._chunk(pending_entries):
+            # 채점 결과가 원래 결과에 섞이지 않도록 복사해서 넘긴다.
+            with span("score", entries=len(chunk)):
+                scored = evaluator.score_batch([dict(self._stored_results[index]) for index, _, _ in chunk])
+            for (index, _, _), result in zip(chunk, scored):
+                self._record_result(index, result)
+
+    async def _arescore_entries(self, evaluator, pending_entries: List[Tuple[int, Dict[str, str], str]]):
+        semaphore = asyncio.Semaphore(self.judge_concurrency)
+        # 팩 단위 채점(LLM judge)은 팩 하나씩, 일괄 채점은 persist_batch_size 단위로 동시에 호출한다.
+        chunk_size = evaluator.pack_size if evaluator.pipelined_scoring else self.persist_batch_size
+        chunks = [pending_entries[i:i + chunk_size] for i in range(0, len(pending_entries), chunk_size)]
+
+        async def score_chunk(chunk):
+            async with semaphore, span("score", entries=len(chunk)):
+                scored = await evaluator.ascore_batch([dict(self._stored_results[index]) for index, _, _ in chunk])
+            for (index, _, _), result in zip(chunk, scored):
+                self._record_result(index, result)
+
+        await asyncio.gather(*[score_chunk(chunk) for chunk in chunks])
+
+    def _chunk(self, entries: List[Any]) -> List[List[Any]]:
+        return [entries[i:i + self.persist_batch_size] for i in range(0, len(entries), self.persist_batch_size)]
+
+    def _start_evaluation(self, resume_evaluation_id: int = None) -> List[Tuple[int, Dict[str, str], str]]:
+        """ evaluations 행을 먼저 만들고(또는 재개할 행을 불러오고), 아직 수행하지 않은 엔트리 목록을 반환한다. """
+        self.results = [None] * len(self.dataset_entries)
+        self._unsaved_results = []
+        self.metrics = MetricsAccumulator(total=len(self.dataset_entries))
+
+        with span("sqlite.start_evaluation"):
+            cursor = self.conn.cursor()
+            if resume_evaluation_id is None:
+                cursor.execute('''
+                    INSERT INTO evaluations (evaluation_type, metadata, token_usage, latency, score, status, parent_evaluation_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    self.evaluation_type.value,
+                    encode_json(self.metadata),
+                    encode_json({}),
+                    encode_json({}),
+                    0,
+                    EvaluationStatus.RUNNING.value,
+                    self.parent_evaluation_id
+                ))
+                self.evaluation_id = cursor.lastrowid
+            else:
+                self.evaluation_id = resume_evaluation_id
+                for index, result in self._load_saved_results(resume_evaluation_id):
+                    if index < len(self.results) and self.results[index] is None:
+                        self.results[index] = result
+                        self.metrics.add(result, processed=False)
+                # 이미 완료된 평가는 상태를 되돌리지 않는다. (롤업에 중복으로 더해지지 않도록)
+                cursor.execute(
+                    "UPDATE evaluations SET status = ? WHERE id = ? AND status IS NOT ?",
+                    (EvaluationStatus.RUNNING.value, self.evaluation_id, EvaluationStatus.COMPLETED.value)
+                )
+            self.conn.commit()
+
+        return [
+            (index, input_variables, reference_output)
+            for index, (input_variables, reference_output) in enumerate(self.dataset_entries)
+            if self.results[index] is None
+        ]
+
+    def _load_saved_results(self, evaluation_id: int) -> List[Tuple[int, Dict[str, Any]]]:
         cursor = self.conn.cursor()
         cursor.execute('''
-            INSERT INTO evaluations (evaluation_type, metadata, token_usage, latency, score)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            self.evaluation_type.value,
-            str(self.metadata),
-            str(self.token_usage),
-            str(self.latency),
-            self.score
-        ))
-        evaluation_id = cursor.lastrowid
-
-        for result in self.results:
-            metadata = {k: v for k, v in result.items() if k not in ["input_variables", "output", "reference_output", "input_token", "output_token", "latency", "score"]}
+            SELECT entry_index, input_variables, OUTPUT, reference_output, input_token, output_token, latency, metadata, score, scores,
+                   ttft, tokens_per_second, itl_p50, itl_p99
+            FROM evaluation_details
+            WHERE evaluation_id = ? AND entry_index IS NOT NULL
+        ''', (evaluation_id,))
 
-            cursor.execute('''
-                INSERT INTO evaluation_details (evaluation_id, input_variables, output, reference_output, input_token, output_token, latency, metadata, score)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                evaluation_id,
-                str(result["input_variables"]),
+        saved_results = []
+        for row in cursor.fetchall():
+            result = {
+                "input_variables": decode_json(row[1]),
+                "output": row[2],
+                "reference_output": row[3],
+                "input_token": row[4],
+                "output_token": row[5],
+                "latency": row[6],
+                "score": row[8],
+            }
+            if row[9] is not None:
+                result["scores"] = decode_json(row[9])
+            result.update({column: value for column, value in zip(STREAMING_COLUMNS, row[10:]) if value is not None})
+            result.update(decode_json(row[7]) or {})
+            saved_results.append((row[0], result))
+        return saved_results
+
+    def _record_result(self, index: int, result: Dict[str, Any]):
+        self.results[index] = result
+        self.metrics.add(result)
+        self._unsaved_results.append((index, result))
+        if len(self._unsaved_results) >= self.persist_batch_size:
+            self._save_evaluation_details()
+        if self.progress_callback is not None:
+            self.progress_callback(self.metrics.snapshot())
+
+    def _save_evaluation_details(self):
+        """ 쌓여 있는 결과를 하나의 트랜잭션으로 evaluation_details 에 추가한다. """
+        if not self._unsaved_results:
+            return
+
+        rows = []
+        for index, result in self._unsaved_results:
+            metadata = {k: v for k, v in result.items() if k not in RESULT_COLUMNS}
+            rows.append((
+                self.evaluation_id,
+                index,
+                encode_json(result["input_variables"]),
                 result["output"],
                 result["reference_output"],
                 result["input_token"],
                 result["output_token"],
                 result["latency"],
-                str(metadata),
-                result["score"]
+                encode_json(metadata),
+                result["score"],
+                encode_json(result.get("scores")),
+                *[result.get(column) for column in STREAMING_COLUMNS]
             ))
 
+        with span("sqlite.save_details", rows=len(rows)):
+            cursor = self.conn.cursor()
+            cursor.executemany('''
+                INSERT INTO evaluation_details (evaluation_id, entry_index, input_variables, output, reference_output, input_token, output_token, latency, metadata, score, scores,
+                                                ttft, tokens_per_second, itl_p50, itl_p99)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.commit()
+        self._unsaved_results = []
+
+    def _fail_evaluation(self):
+        self._save_evaluation_details()
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE evaluations SET status = ? WHERE id = ?",
+            (EvaluationStatus.FAILED.value, self.evaluation_id)
+        )
         self.conn.commit()
+
+    def _finish_evaluation(self, evaluator):
+        self._save_evaluation_details()
+        for member in getattr(evaluator, "evaluators", [evaluator]):
+            if hasattr(member, "judge_usage"):
+                self.metadata["judge_usage"] = dict(member.judge_usage)
+        self._calculate_evaluation_metrics()
+        self._save_evaluation_results()
+
+        return self.results
+
+    def _calculate_evaluation_metrics(self):
+        """ 결과를 기록하면서 누적한 값으로 계산한다. (결과가 2048개 이하면 pandas quantile 과 같은 값, 그보다 많으면 1% 이내 오차) """
+        self.token_usage = self.metrics.token_usage_quantiles()
+        self.latency = self.metrics.latency_quantiles()
+        self.ttft = self.metrics.ttft_quantiles()
+        self.tokens_per_second = self.metrics.tokens_per_second_quantiles()
+        self.score = self.metrics.score
+        if len(self.evaluation_types) > 1:
+            self.scores = self.metrics.scores
+
+        if self.response_cache is not None:
+            self.metadata["cache_hits"] = self.metrics.cache_hits
+
+    def _save_evaluation_results(self):
+        with span("sqlite.save_results"):
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE evaluations SET metadata = ?, token_usage = ?, latency = ?, ttft = ?, tokens_per_second = ?, score = ?, scores = ?, status = ?
+                WHERE id = ? AND status IS NOT ?
+            ''', (
+                encode_json(self.metadata),
+                encode_json(self.token_usage),
+                encode_json(self.latency),
+                encode_json(self.ttft),
+                encode_json(self.tokens_per_second),
+                self.score,
+                encode_json(self.scores),
+                EvaluationStatus.COMPLETED.value,
+                self.evaluation_id,
+                EvaluationStatus.COMPLETED.value
+            ))
+            # 이미 완료된 평가를 다시 재개한 경우에는 롤업에 중복으로 더하지 않는다.
+            if cursor.rowcount:
+                EvaluationRollup.record_evaluation(cursor, self.evaluation_id, self.metadata, self.metrics)
+            self.conn.commit()
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    # 중단된 재채점을 run_rescoring(resume_evaluation_id=...) 로 이어서 끝낼 수 있는지 확인
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = os.path.join(tmp_dir, "evaluation.db")
+        conn = get_connection(database)
+        parent_id = conn.execute(
+            "INSERT INTO evaluations (evaluation_type, metadata, token_usage, latency, score, status) VALUES (?, ?, '{}', '{}', 0.5, ?)",
+            (EvaluatorType.EXACT_MATCH.value, encode_json({"prompt": "demo", "model": "demo"}), EvaluationStatus.COMPLETED.value)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO evaluation_details (evaluation_id, entry_index, input_variables, OUTPUT, reference_output, input_token, output_token, latency, score) "
+            "VALUES (?, ?, ?, 'a', ?, 3, 2, 0.1, 0)",
+            [(parent_id, i, encode_json({"question": f"q{i}"}), "a" if i % 2 == 0 else "b") for i in range(6)]
+        )
+        conn.commit()
+
+        def interrupt(snapshot: Dict[str, Any]):
+            if snapshot["completed"] == 3:
+                raise KeyboardInterrupt
+
+        try:
+            Evaluation.rescore(parent_id, [EvaluatorType.EXACT_MATCH], database=database, persist_batch_size=1, progress_callback=interrupt)
+        except KeyboardInterrupt:
+            pass
+        failed_id, = conn.execute("SELECT id FROM evaluations WHERE parent_evaluation_id = ?", (parent_id,)).fetchone()
+
+        resumed = Evaluation(None, EvaluatorType.EXACT_MATCH, [], database=database)
+        results = resumed.run_rescoring(resume_evaluation_id=failed_id)
+        status, = conn.execute("SELECT status FROM evaluations WHERE id = ?", (failed_id,)).fetchone()
+        assert resumed.parent_evaluation_id == parent_id
+        assert len(results) == 6 and status == EvaluationStatus.COMPLETED.value, (len(results), status)
+        assert resumed.score == 0.5, resumed.score
+        assert conn.execute("SELECT COUNT(*) FROM evaluation_details WHERE evaluation_id = ?", (failed_id,)).fetchone()[0] == 6
+        print(f"resumed re-scoring {failed_id} of {parent_id}: {len(results)} entries, score={resumed.score}, metadata={resumed.metadata}")
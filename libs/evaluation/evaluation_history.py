@@ -0,0 +1,193 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from libs.util.database import get_connection
+from libs.util.json_util import decode_json
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+# metadata/latency JSON 에서 만들어지는 생성 컬럼 (libs/util/migration.py 참고)
+GENERATED_COLUMNS = ["prompt", "prompt_version_id", "model", "dataset", "latency_p50", "latency_p99"]
+# 조회할 수 있는 evaluations 컬럼, metadata/token_usage/latency/ttft/tokens_per_second 는 값이 크므로 필요할 때만 projection 에 포함한다.
+EVALUATION_COLUMNS = ["id", "TIMESTAMP", "evaluation_type", "status", "score", "metadata", "token_usage", "latency", "ttft", "tokens_per_second",
+                      "scores", "parent_evaluation_id"] + GENERATED_COLUMNS
+DEFAULT_EVALUATION_COLUMNS = ["id", "TIMESTAMP", "evaluation_type", "status", "prompt", "prompt_version_id", "model", "dataset", "score", "scores", "latency_p50", "latency_p99", "parent_evaluation_id"]
+SORT_COLUMNS = ["id", "TIMESTAMP", "evaluation_type", "status", "score", "latency_p50", "latency_p99"]
+DECODED_COLUMNS = ["metadata", "token_usage", "latency", "ttft", "tokens_per_second", "scores"]
+# 값이 같은 행만 남기는 필터
+EQUALITY_FILTERS = ["prompt", "prompt_version_id", "model", "dataset", "evaluation_type", "status", "parent_evaluation_id"]
+# summarize 에서 묶을 수 있는 기준, day 는 TIMESTAMP 의 날짜(UTC)
+GROUP_BY_COLUMNS = {
+    "prompt": "prompt",
+    "prompt_version_id": "prompt_version_id",
+    "model": "model",
+    "dataset": "dataset",
+    "evaluation_type": "evaluation_type",
+    "day": "date(TIMESTAMP)",
+}
+
+DETAIL_COLUMNS = ["id", "entry_index", "input_variables", "OUTPUT", "reference_output", "input_token", "output_token", "latency", "metadata", "score", "scores",
+                  "ttft", "tokens_per_second", "itl_p50", "itl_p99"]
+
+DateLike = Union[str, date, datetime]
+
+
+class EvaluationHistory:
+    """ 평가 이력을 페이지 단위로 조회한다. 필터, 정렬, 페이지 나누기는 모두 SQL 에서 처리한다. """
+
+    def __init__(self, database: str = DEFAULT_DATABASE_PATH):
+        self.database = database
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
+    def get_evaluations(self,
+                        columns: List[str] = None,
+                        sort_by: str = "id",
+                        descending: bool = True,
+                        limit: int = 50,
+                        offset: int = 0,
+                        **filters) -> List[Dict[str, Any]]:
+        """ filters: prompt, prompt_version_id, model, dataset, evaluation_type, status,
+        start_date, end_date (date 는 해당 일 전체 포함), min_score, max_score
+        """
+        columns = columns or DEFAULT_EVALUATION_COLUMNS
+        unknown_columns = [column for column in columns if column not in EVALUATION_COLUMNS]
+        if unknown_columns:
+            raise ValueError(f"Unknown columns: {unknown_columns}. Available columns: {EVALUATION_COLUMNS}")
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort_by}'. Available columns: {SORT_COLUMNS}")
+
+        where, params = self._build_where(filters)
+        # 정렬 값이 같은 행끼리도 페이지 사이에서 순서가 바뀌지 않도록 id 를 함께 정렬
+        order = "DESC" if descending else "ASC"
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM evaluations {where} ORDER BY {sort_by} {order}, id {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [self._to_evaluation(columns, row) for row in cursor.fetchall()]
+
+    def count_evaluations(self, **filters) -> int:
+        where, params = self._build_where(filters)
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM evaluations {where}", params)
+        return cursor.fetchone()[0]
+
+    def summarize(self, group_by: List[str], **filters) -> List[Dict[str, Any]]:
+        """ 완료된 평가를 group_by 기준으로 묶어 점수와 지연 시간 통계를 SQL 에서 계산한다.
+
+        status 컬럼 도입 전에 저장된 평가는 마이그레이션에서 completed 로 채워지므로 기본 필터에 포함된다.
+
+        latency_p50/p99 는 평가별 분위수이므로 avg/max 는 평가 단위 값의 평균/최댓값이다.
+        예) 최근 한 달 모델별 p99: summarize(["model"], start_date=date.today() - timedelta(days=30))
+        """
+        unknown = [key for key in group_by if key not in GROUP_BY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {unknown}. Available keys: {list(GROUP_BY_COLUMNS)}")
+
+        filters.setdefault("status", "completed")
+        where, params = self._build_where(filters)
+        group_expressions = [GROUP_BY_COLUMNS[key] for key in group_by]
+        select_groups = "".join(f"{expression} AS {key}, " for key, expression in zip(group_by, group_expressions))
+        group_clause = f"GROUP BY {', '.join(group_expressions)} ORDER BY {', '.join(group_expressions)}" if group_by else ""
+
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {select_groups}
+                COUNT(*) AS evaluations,
+                AVG(score) AS avg_score,
+                MIN(score) AS min_score,
+                MAX(score) AS max_score,
+                AVG(latency_p50) AS avg_latency_p50,
+                AVG(latency_p99) AS avg_latency_p99,
+                MAX(latency_p99) AS max_latency_p99
+            FROM evaluations {where}
+            {group_clause}
+        ''', params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def get_evaluation(self, evaluation_id: int, columns: List[str] = None) -> Optional[Dict[str, Any]]:
+        columns = columns or EVALUATION_COLUMNS
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT {', '.join(columns)} FROM evaluations WHERE id = ?", (evaluation_id,))
+        row = cursor.fetchone()
+        return self._to_evaluation(columns, row) if row else None
+
+    def get_details(self, evaluation_id: int, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(DETAIL_COLUMNS)} FROM evaluation_details
+            WHERE evaluation_id = ?
+            ORDER BY entry_index, id
+            LIMIT ? OFFSET ?
+        ''', (evaluation_id, limit, offset))
+
+        details = []
+        for row in cursor.fetchall():
+            detail = dict(zip(DETAIL_COLUMNS, row))
+            detail["input_variables"] = decode_json(detail["input_variables"])
+            detail["metadata"] = decode_json(detail["metadata"])
+            detail["scores"] = decode_json(detail["scores"])
+            details.append(detail)
+        return details
+
+    def count_details(self, evaluation_id: int) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM evaluation_details WHERE evaluation_id = ?", (evaluation_id,))
+        return cursor.fetchone()[0]
+
+    def _build_where(self, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        conditions = []
+        params = []
+
+        for key, value in filters.items():
+            if value is None:
+                continue
+
+            if key in EQUALITY_FILTERS:
+                conditions.append(f"{key} = ?")
+                params.append(value)
+            elif key == "start_date":
+                conditions.append("TIMESTAMP >= ?")
+                params.append(self._to_timestamp(value))
+            elif key == "end_date":
+                if isinstance(value, date) and not isinstance(value, datetime):
+                    conditions.append("TIMESTAMP < ?")
+                    params.append(self._to_timestamp(value + timedelta(days=1)))
+                else:
+                    conditions.append("TIMESTAMP <= ?")
+                    params.append(self._to_timestamp(value))
+            elif key == "min_score":
+                conditions.append("score >= ?")
+                params.append(value)
+            elif key == "max_score":
+                conditions.append("score <= ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unknown filter: '{key}'")
+
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    @staticmethod
+    def _to_timestamp(value: DateLike) -> str:
+        # evaluations.TIMESTAMP 는 CURRENT_TIMESTAMP 형식(YYYY-MM-DD HH:MM:SS, UTC)
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if isinstance(value, date):
+            return value.strftime("%Y-%m-%d 00:00:00")
+        return value
+
+    @staticmethod
+    def _to_evaluation(columns: List[str], row) -> Dict[str, Any]:
+        evaluation = dict(zip(columns, row))
+        for column in DECODED_COLUMNS:
+            if column in evaluation:
+                try:
+                    evaluation[column] = decode_json(evaluation[column])
+                except (ValueError, SyntaxError):
+                    # nan 등 literal_eval 로 읽을 수 없는 값은 문자열 그대로 둔다.
+                    pass
+        return evaluation
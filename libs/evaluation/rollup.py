@@ -0,0 +1,226 @@
+import json
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from libs.evaluation.metrics import QUANTILES, MetricsAccumulator, QuantileSketch
+from libs.util.database import get_connection
+from libs.util.json_util import decode_json
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+# 롤업 한 행을 구분하는 키, 값이 없으면 "" (prompt_version_id 는 0) 으로 저장한다.
+ROLLUP_KEYS = ["evaluation_type", "prompt", "prompt_version_id", "model", "dataset"]
+# 롤업 행의 스케치는 정확한 값 대신 버킷을 일찍 사용해 행 크기를 작게 유지한다.
+ROLLUP_EXACT_LIMIT = 256
+PERIODS = ["day", "week", "month"]
+
+DateLike = Union[str, date]
+
+
+class EvaluationRollup:
+    """ (evaluation_type, prompt, prompt_version_id, model, dataset, day) 별 평가 결과 집계.
+
+    평가가 완료될 때 해당 평가의 스케치를 같은 트랜잭션에서 합쳐 두므로,
+    추이 조회는 평가/엔트리 수와 관계없이 (그룹 수 x 기간) 만큼의 행만 읽는다.
+    """
+
+    def __init__(self, database: str = DEFAULT_DATABASE_PATH):
+        self.database = database
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
+    @staticmethod
+    def record_evaluation(cursor: sqlite3.Cursor, evaluation_id: int, metadata: Dict[str, Any], metrics: MetricsAccumulator):
+        """ 완료된 평가 하나를 롤업에 합친다. 호출한 쪽의 트랜잭션 안에서 실행되며 커밋은 호출한 쪽에서 한다. """
+        cursor.execute("SELECT date(TIMESTAMP), evaluation_type FROM evaluations WHERE id = ?", (evaluation_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+
+        # 여러 평가자로 채점한 평가는 평가자별 행에 각각 더한다.
+        score_sums = metrics.score_sums or {row[1]: metrics.score_sum}
+        for evaluation_type, score_sum in score_sums.items():
+            key = EvaluationRollup._to_key(dict(metadata, evaluation_type=evaluation_type))
+            EvaluationRollup._merge_into(
+                cursor, key, row[0], metrics.count, score_sum, metrics.token_usage, metrics.latency
+            )
+
+    @staticmethod
+    def _merge_into(cursor: sqlite3.Cursor,
+                    key: Tuple,
+                    day: str,
+                    entries: int,
+                    score_sum: float,
+                    token_usage: QuantileSketch,
+                    latency: QuantileSketch):
+        cursor.execute(f'''
+            SELECT entries, score_sum, token_usage_sketch, latency_sketch FROM evaluation_rollups
+            WHERE {" AND ".join(f"{k} = ?" for k in ROLLUP_KEYS)} AND day = ?
+        ''', key + (day,))
+        row = cursor.fetchone()
+
+        token_sketch = QuantileSketch(token_usage.relative_accuracy, ROLLUP_EXACT_LIMIT)
+        latency_sketch = QuantileSketch(latency.relative_accuracy, ROLLUP_EXACT_LIMIT)
+        if row is not None:
+            entries += row[0]
+            score_sum += row[1]
+            token_sketch = QuantileSketch.from_dict(json.loads(row[2]))
+            latency_sketch = QuantileSketch.from_dict(json.loads(row[3]))
+        token_sketch.merge(token_usage)
+        latency_sketch.merge(latency)
+
+        cursor.execute(f'''
+            INSERT INTO evaluation_rollups ({", ".join(ROLLUP_KEYS)}, day, evaluations, entries, score_sum, token_usage_sketch, latency_sketch)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
+            ON CONFLICT ({", ".join(ROLLUP_KEYS)}, day) DO UPDATE SET
+                evaluations = evaluations + 1,
+                entries = excluded.entries,
+                score_sum = excluded.score_sum,
+                token_usage_sketch = excluded.token_usage_sketch,
+                latency_sketch = excluded.latency_sketch,
+                TIMESTAMP = CURRENT_TIMESTAMP
+        ''', key + (
+            day,
+            entries,
+            score_sum,
+            json.dumps(token_sketch.to_dict()),
+            json.dumps(latency_sketch.to_dict())
+        ))
+
+    def rebuild(self, batch_size: int = 1000):
+        """ 롤업을 비우고 완료된 평가의 evaluation_details 로 다시 만든다. """
+        conn = self.conn
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            rebuild_rollups(cursor, batch_size)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def get_trends(self,
+                   period: str = "day",
+                   group_by: List[str] = None,
+                   start_date: Optional[DateLike] = None,
+                   end_date: Optional[DateLike] = None,
+                   quantiles: List[float] = None,
+                   **filters) -> List[Dict[str, Any]]:
+        """ period(day/week/month) 와 group_by(ROLLUP_KEYS 중 일부) 별 점수, 토큰 사용량, 지연 시간 분위수
+
+        filters: evaluation_type, prompt, prompt_version_id, model, dataset (같은 값만 포함)
+        평가자마다 점수의 의미가 다르므로 evaluation_type 으로 거르거나 묶어서 조회해야 한다.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: '{period}'. Available periods: {PERIODS}")
+        group_by = ROLLUP_KEYS if group_by is None else group_by
+        unknown = [key for key in list(group_by) + list(filters) if key not in ROLLUP_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown keys: {unknown}. Available keys: {ROLLUP_KEYS}")
+
+        conditions = []
+        params = []
+        for key, value in filters.items():
+            if value is not None:
+                conditions.append(f"{key} = ?")
+                params.append(value)
+        if start_date:
+            conditions.append("day >= ?")
+            params.append(str(start_date))
+        if end_date:
+            conditions.append("day <= ?")
+            params.append(str(end_date))
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {", ".join(ROLLUP_KEYS)}, day, evaluations, entries, score_sum, token_usage_sketch, latency_sketch
+            FROM evaluation_rollups {where}
+            ORDER BY day
+        ''', params)
+
+        # 같은 (기간, group_by) 에 속하는 행의 스케치를 합친다.
+        groups: Dict[Tuple, Dict[str, Any]] = {}
+        for row in cursor.fetchall():
+            values = dict(zip(ROLLUP_KEYS, row[:len(ROLLUP_KEYS)]))
+            day, evaluations, entries, score_sum, token_usage_sketch, latency_sketch = row[len(ROLLUP_KEYS):]
+            group_key = (self._period_start(day, period),) + tuple(values[key] for key in group_by)
+            token_usage = QuantileSketch.from_dict(json.loads(token_usage_sketch))
+            latency = QuantileSketch.from_dict(json.loads(latency_sketch))
+
+            group = groups.get(group_key)
+            if group is None:
+                groups[group_key] = {
+                    "evaluations": evaluations,
+                    "entries": entries,
+                    "score_sum": score_sum,
+                    "token_usage": token_usage,
+                    "latency": latency,
+                }
+            else:
+                group["evaluations"] += evaluations
+                group["entries"] += entries
+                group["score_sum"] += score_sum
+                group["token_usage"].merge(token_usage)
+                group["latency"].merge(latency)
+
+        trends = []
+        for group_key, group in groups.items():
+            trend = {period: group_key[0]}
+            # 저장할 때 ""/0 으로 바꾼 빈 키는 None 으로 돌려준다.
+            trend.update({key: value or None for key, value in zip(group_by, group_key[1:])})
+            trend.update({
+                "evaluations": group["evaluations"],
+                "entries": group["entries"],
+                "score": group["score_sum"] / group["entries"] if group["entries"] else None,
+                "token_usage_mean": group["token_usage"].mean(),
+            })
+            for q in quantiles or QUANTILES:
+                trend[f"token_usage_p{q * 100:g}"] = group["token_usage"].quantile(q)
+                trend[f"latency_p{q * 100:g}"] = group["latency"].quantile(q)
+            trends.append(trend)
+        return trends
+
+    @staticmethod
+    def _to_key(metadata: Dict[str, Any]) -> Tuple:
+        return tuple(
+            (metadata.get(key) or 0) if key == "prompt_version_id" else str(metadata.get(key) or "")
+            for key in ROLLUP_KEYS
+        )
+
+    @staticmethod
+    def _period_start(day: str, period: str) -> str:
+        if period == "day":
+            return day
+        value = date.fromisoformat(day)
+        if period == "week":
+            return str(value - timedelta(days=value.weekday()))
+        return str(value.replace(day=1))
+
+
+def rebuild_rollups(cursor: sqlite3.Cursor, batch_size: int = 1000):
+    """ 완료된 평가의 evaluation_details 로 롤업을 다시 만든다. (롤업 도입 전 이력 반영, 호출한 쪽 트랜잭션에서 실행) """
+    cursor.execute("DELETE FROM evaluation_rollups")
+    cursor.execute("SELECT id, metadata FROM evaluations WHERE status = 'completed' ORDER BY id")
+    for evaluation_id, metadata in cursor.fetchall():
+        metrics = MetricsAccumulator(total=0)
+        details = cursor.connection.execute(
+            "SELECT input_token, output_token, latency, score, scores FROM evaluation_details WHERE evaluation_id = ?",
+            (evaluation_id,)
+        )
+        while True:
+            rows = details.fetchmany(batch_size)
+            if not rows:
+                break
+            for input_token, output_token, latency, score, scores in rows:
+                metrics.add({
+                    "input_token": input_token or 0,
+                    "output_token": output_token or 0,
+                    "latency": latency or 0.0,
+                    "score": score,
+                    "scores": decode_json(scores),
+                })
+        if metrics.count:
+            EvaluationRollup.record_evaluation(cursor, evaluation_id, decode_json(metadata) or {}, metrics)
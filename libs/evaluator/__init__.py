@@ -2,6 +2,7 @@ from .evaluator import Evaluator, EvaluatorType, create_evaluator
 from .exact_match_evaluator import ExactMatchEvaluator
 from .embedding_distance_evaluator import EmbeddingDistanceEvaluator
 from .llm_judge_evaluator import LLMJudgeEvaluator
+from .multi_evaluator import MultiEvaluator
 
 __all__ = [
     "EvaluatorType",
@@ -10,4 +11,5 @@ __all__ = [
     "ExactMatchEvaluator",
     "EmbeddingDistanceEvaluator",
     "LLMJudgeEvaluator",
+    "MultiEvaluator",
 ]
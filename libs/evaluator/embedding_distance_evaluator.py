@@ -1,22 +1,93 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 from libs.evaluator import Evaluator
+from libs.model.response_cache import ResponseCache
+from libs.util.embedding_cache import EmbeddingCache
+from libs.util.tracing import span
 
-from langchain.evaluation import load_evaluator, EvaluatorType
+import numpy as np
 from langchain_core.runnables.base import Runnable
 from langchain_core.embeddings import Embeddings
 
 
 class EmbeddingDistanceEvaluator(Evaluator):
+    batch_scoring = True
 
-    def __init__(self, chain: Runnable, embedding_model: Embeddings):
-        super().__init__(chain)
+    def __init__(self,
+                 chain: Runnable,
+                 embedding_model: Embeddings,
+                 response_cache: ResponseCache = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 measure_streaming: bool = False):
+        super().__init__(chain, response_cache, measure_streaming)
         self.embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
+        self.embedding_model_name = getattr(embedding_model, "model", None) or type(embedding_model).__name__
 
-    def evaluate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
-        result = super().evaluate(input_variables, reference_output)
-        result["score"] = round(float(self.calculate_embedding_distance(result["output"], reference_output)), 2)
-        return result
+    def score(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return self.score_batch([result])[0]
+
+    async def ascore(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.ascore_batch([result]))[0]
+
+    def score_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        outputs = [result["output"] for result in results]
+        references = [result["reference_output"] or "" for result in results]
+
+        output_embeddings = self._embed(outputs)
+        reference_embeddings = self._embed(references, use_cache=True)
+        return self._apply_distances(results, output_embeddings, reference_embeddings)
+
+    async def ascore_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        outputs = [result["output"] for result in results]
+        references = [result["reference_output"] or "" for result in results]
+
+        output_embeddings = await self._aembed(outputs)
+        reference_embeddings = await self._aembed(references, use_cache=True)
+        return self._apply_distances(results, output_embeddings, reference_embeddings)
 
     def calculate_embedding_distance(self, output: str, reference_output: str) -> float:
-        evaluator = load_evaluator(evaluator=EvaluatorType.EMBEDDING_DISTANCE, embeddings=self.embedding_model)
-        return evaluator.evaluate_strings(prediction=output, reference=reference_output)["score"]
+        distances = cosine_distances(self._embed([output]), self._embed([reference_output], use_cache=True))
+        return float(distances[0])
+
+    def _apply_distances(self, results, output_embeddings: np.ndarray, reference_embeddings: np.ndarray):
+        distances = cosine_distances(output_embeddings, reference_embeddings)
+        for result, distance in zip(results, distances):
+            result["score"] = round(float(distance), 2)
+        return results
+
+    def _embed(self, texts: List[str], use_cache: bool = False) -> np.ndarray:
+        embeddings = self._lookup(texts, use_cache)
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            # embed_documents 는 내부적으로 batch_size 단위로 묶어 요청한다.
+            with span("embedding", texts=len(missing)):
+                vectors = self.embedding_model.embed_documents(missing)
+            embeddings.update(self._store(missing, vectors, use_cache))
+        return np.vstack([embeddings[text] for text in texts])
+
+    async def _aembed(self, texts: List[str], use_cache: bool = False) -> np.ndarray:
+        embeddings = self._lookup(texts, use_cache)
+        missing = [text for text in dict.fromkeys(texts) if text not in embeddings]
+        if missing:
+            async with span("embedding", texts=len(missing)):
+                vectors = await self.embedding_model.aembed_documents(missing)
+            embeddings.update(self._store(missing, vectors, use_cache))
+        return np.vstack([embeddings[text] for text in texts])
+
+    def _lookup(self, texts: List[str], use_cache: bool) -> Dict[str, np.ndarray]:
+        if use_cache and self.embedding_cache is not None:
+            return self.embedding_cache.get_many(self.embedding_model_name, texts)
+        return {}
+
+    def _store(self, texts: List[str], vectors: List[List[float]], use_cache: bool) -> Dict[str, np.ndarray]:
+        embeddings = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(texts, vectors)}
+        if use_cache and self.embedding_cache is not None:
+            self.embedding_cache.set_many(self.embedding_model_name, embeddings)
+        return embeddings
+
+
+def cosine_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ 두 행렬의 같은 행끼리 코사인 거리(1 - 코사인 유사도)를 한 번에 계산 """
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    similarities = np.einsum("ij,ij->i", a, b) / np.maximum(norms, np.finfo(np.float32).eps)
+    return 1.0 - similarities
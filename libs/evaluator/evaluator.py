@@ -1,13 +1,20 @@
 import time
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables.base import Runnable
 
 from libs.model.model_provider import ChatModelManager
+from libs.model.rate_controller import acall_with_retry, call_with_retry, measure_call
+from libs.model.response_cache import ResponseCache
+from libs.util.embedding_cache import EmbeddingCache
+from libs.util.tracing import span
 
 
 class EvaluatorType(Enum):
@@ -17,22 +24,178 @@ class EvaluatorType(Enum):
 
 
 class Evaluator:
-    def __init__(self, chain: Runnable):
+    # True 이면 Evaluation 이 전체 출력을 먼저 생성한 뒤 score_batch 로 한 번에 채점한다.
+    batch_scoring = False
+    # True 이면 Evaluation 이 생성 결과를 별도의 채점 작업 풀로 흘려보내 생성과 채점을 겹쳐 수행한다.
+    pipelined_scoring = False
+    # 채점 호출 한 번에 묶어서 넘길 결과 수
+    pack_size = 1
+
+    def __init__(self, chain: Runnable, response_cache: ResponseCache = None, measure_streaming: bool = False):
         self.chain = chain
+        self.response_cache = response_cache
+        # True 이면 스트리밍으로 생성해 첫 토큰까지의 시간(TTFT), 초당 출력 토큰 수, 토큰 간 지연 시간을 함께 측정한다.
+        self.measure_streaming = measure_streaming
 
     def evaluate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
-        start_time = time.time()
-        response = self.chain.invoke(input_variables)
-        latency = time.time() - start_time
+        result = self.generate(input_variables, reference_output)
+        with span("score"):
+            return self.score(result)
+
+    async def aevaluate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
+        result = await self.agenerate(input_variables, reference_output)
+        async with span("score"):
+            return await self.ascore(result)
+
+    def score(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return result
+
+    async def ascore(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return self.score(result)
+
+    def score_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self.score(result) for result in results]
+
+    async def ascore_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [await self.ascore(result) for result in results]
+
+    def generate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
+        with span("generate", streaming=self.measure_streaming) as generate_span:
+            result = self._generate(input_variables, reference_output)
+            generate_span.set_attribute("cached", bool(result.get("cached")))
+        return result
+
+    async def agenerate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
+        async with span("generate", streaming=self.measure_streaming) as generate_span:
+            result = await self._agenerate(input_variables, reference_output)
+            generate_span.set_attribute("cached", bool(result.get("cached")))
+        return result
+
+    def _generate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
+        cache_key = self._get_cache_key(input_variables)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        if cached:
+            return self._build_result(input_variables, reference_output, cached["output"], cached["usage_metadata"], cached["latency"], cached=True)
+
+        # 호출 한도 초과(429), 과부하 오류는 모델의 RateController 정책으로 다시 시도한다.
+        if self.measure_streaming:
+            response, latency, stream_metrics = call_with_retry(self.chain, lambda: self._stream(input_variables))
+            return self._save_response(cache_key, input_variables, reference_output, response, latency, stream_metrics)
+
+        response, latency = call_with_retry(self.chain, lambda: self._invoke(input_variables))
+        return self._save_response(cache_key, input_variables, reference_output, response, latency)
+
+    async def _agenerate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
+        cache_key = self._get_cache_key(input_variables)
+        cached = self.response_cache.get(cache_key) if cache_key else None
+        if cached:
+            return self._build_result(input_variables, reference_output, cached["output"], cached["usage_metadata"], cached["latency"], cached=True)
 
+        if self.measure_streaming:
+            response, latency, stream_metrics = await acall_with_retry(self.chain, lambda: self._astream(input_variables))
+            return self._save_response(cache_key, input_variables, reference_output, response, latency, stream_metrics)
+
+        response, latency = await acall_with_retry(self.chain, lambda: self._ainvoke(input_variables))
+        return self._save_response(cache_key, input_variables, reference_output, response, latency)
+
+    # 아래 호출 함수는 재시도마다 새로 실행되고, 호출 한도(RateController) 대기가 끝난 시점부터 측정한다.
+    # 동시 실행 시 대기 시간과 재시도 백오프가 섞이지 않도록 성공한 호출 구간만 지연 시간으로 남긴다.
+    def _invoke(self, input_variables: dict) -> Tuple[BaseMessage, float]:
+        with measure_call() as timing:
+            response = self.chain.invoke(input_variables)
+            return response, time.perf_counter() - timing.started_at
+
+    async def _ainvoke(self, input_variables: dict) -> Tuple[BaseMessage, float]:
+        with measure_call() as timing:
+            response = await self.chain.ainvoke(input_variables)
+            return response, time.perf_counter() - timing.started_at
+
+    def _stream(self, input_variables: dict) -> Tuple[BaseMessage, float, Dict[str, Optional[float]]]:
+        """ 청크를 이어 붙여 응답 메시지를 만들고 내용이 있는 청크의 도착 시각을 기록한다. """
+        response = None
+        arrivals = []
+        with measure_call() as timing:
+            for chunk in self.chain.stream(input_variables):
+                if chunk.content:
+                    arrivals.append(time.perf_counter())
+                response = chunk if response is None else response + chunk
+            end_time = time.perf_counter()
+        # 호출 한도 대기는 첫 청크 전에 끝나므로 스트림이 끝난 뒤의 started_at 이 실제 호출 시작 시각이다.
+        latency = end_time - timing.started_at
+        return response, latency, self._stream_metrics(response, timing.started_at, arrivals, latency)
+
+    async def _astream(self, input_variables: dict) -> Tuple[BaseMessage, float, Dict[str, Optional[float]]]:
+        response = None
+        arrivals = []
+        with measure_call() as timing:
+            async for chunk in self.chain.astream(input_variables):
+                if chunk.content:
+                    arrivals.append(time.perf_counter())
+                response = chunk if response is None else response + chunk
+            end_time = time.perf_counter()
+        latency = end_time - timing.started_at
+        return response, latency, self._stream_metrics(response, timing.started_at, arrivals, latency)
+
+    @staticmethod
+    def _stream_metrics(response: BaseMessage, start_time: float, arrivals: List[float], latency: float) -> Dict[str, Optional[float]]:
+        """ Ollama, Anthropic 은 대부분 청크 하나에 토큰 하나를 보내므로 청크 간격을 토큰 간 지연 시간(ITL)으로 본다.
+
+        tokens_per_second 는 첫 토큰 이후 디코딩 구간의 출력 토큰 처리량이다. (프롬프트 처리 시간은 TTFT 에 포함)
+        """
+        metrics = {"ttft": None, "tokens_per_second": None, "itl_p50": None, "itl_p99": None}
+        if not arrivals:
+            return metrics
+        metrics["ttft"] = arrivals[0] - start_time
+        if len(arrivals) > 1:
+            intervals = np.diff(arrivals)
+            metrics["itl_p50"] = float(np.percentile(intervals, 50))
+            metrics["itl_p99"] = float(np.percentile(intervals, 99))
+        usage_metadata = getattr(response, "usage_metadata", None) or {}
+        decode_seconds = latency - metrics["ttft"]
+        output_tokens = usage_metadata.get("output_tokens")
+        if output_tokens and decode_seconds > 0:
+            # 첫 토큰은 TTFT 구간에 나왔으므로 나머지 토큰으로 계산한다.
+            metrics["tokens_per_second"] = max(output_tokens - 1, 0) / decode_seconds
+        return metrics
+
+    def _get_cache_key(self, input_variables: dict):
+        if self.response_cache is None:
+            return None
+        return self.response_cache.make_key(self.chain, input_variables)
+
+    def _save_response(self,
+                       cache_key,
+                       input_variables: dict,
+                       reference_output: str,
+                       response: Any,
+                       latency: float,
+                       stream_metrics: Dict[str, Optional[float]] = None) -> Dict[str, Any]:
+        if cache_key:
+            self.response_cache.set(cache_key, response.content, response.usage_metadata, latency)
+        return self._build_result(input_variables, reference_output, response.content, response.usage_metadata, latency,
+                                  stream_metrics=stream_metrics)
+
+    def _build_result(self,
+                      input_variables: dict,
+                      reference_output: str,
+                      output: str,
+                      usage_metadata: Dict[str, Any],
+                      latency: float,
+                      cached: bool = False,
+                      stream_metrics: Dict[str, Optional[float]] = None) -> Dict[str, Any]:
         evaluation_result = {
             "input_variables": input_variables,
-            "output": response.content,
+            "output": output,
             "reference_output": reference_output,
-            "input_token": response.usage_metadata["input_tokens"],
-            "output_token": response.usage_metadata["output_tokens"],
+            "input_token": usage_metadata["input_tokens"],
+            "output_token": usage_metadata["output_tokens"],
             "latency": latency,
         }
+        if self.response_cache is not None:
+            # 캐시에서 가져온 결과는 원래 호출의 토큰 사용량과 지연 시간을 그대로 유지한다.
+            evaluation_result["cached"] = cached
+        if stream_metrics is not None:
+            evaluation_result.update(stream_metrics)
 
         return evaluation_result
 
@@ -42,20 +205,36 @@ def create_evaluator(
         chain: Runnable,
         judge_model: BaseChatModel = None,
         embedding_model: Embeddings = None,
+        response_cache: ResponseCache = None,
+        embedding_cache: EmbeddingCache = None,
+        judge_pack_size: int = 1,
+        measure_streaming: bool = False,
 ) -> Evaluator:
     if evaluator_type == EvaluatorType.EXACT_MATCH:
         from libs.evaluator import ExactMatchEvaluator
-        return ExactMatchEvaluator(chain=chain)
+        return ExactMatchEvaluator(chain=chain, response_cache=response_cache, measure_streaming=measure_streaming)
     elif evaluator_type == EvaluatorType.EMBEDDING_DISTANCE:
         if embedding_model is None:
             raise ValueError("embedding_model function must be provided for EmbeddingDistanceEvaluator")
         from libs.evaluator import EmbeddingDistanceEvaluator
-        return EmbeddingDistanceEvaluator(chain=chain, embedding_model=embedding_model)
+        return EmbeddingDistanceEvaluator(
+            chain=chain,
+            embedding_model=embedding_model,
+            response_cache=response_cache,
+            embedding_cache=embedding_cache,
+            measure_streaming=measure_streaming,
+        )
     elif evaluator_type == EvaluatorType.LLM_JUDGE:
         if judge_model is None:
             raise ValueError("judge_model function must be provided for LLMJudgeEvaluator")
         from libs.evaluator import LLMJudgeEvaluator
-        return LLMJudgeEvaluator(chain=chain, judge_model=judge_model)
+        return LLMJudgeEvaluator(
+            chain=chain,
+            judge_model=judge_model,
+            response_cache=response_cache,
+            pack_size=judge_pack_size,
+            measure_streaming=measure_streaming,
+        )
     else:
         raise ValueError(f"Unsupported evaluator type: {evaluator_type}")
 
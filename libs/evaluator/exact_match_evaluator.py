@@ -4,7 +4,6 @@ from libs.evaluator import Evaluator
 
 class ExactMatchEvaluator(Evaluator):
 
-    def evaluate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
-        result = super().evaluate(input_variables, reference_output)
-        result["score"] = float(result["output"] == reference_output)
+    def score(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        result["score"] = float(result["output"] == result["reference_output"])
         return result
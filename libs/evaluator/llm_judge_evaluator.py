@@ -1,6 +1,10 @@
 import json
+import time
 from libs.evaluator import Evaluator
-from typing import Any, Dict
+from libs.model.rate_controller import acall_with_retry, call_with_retry
+from libs.model.response_cache import ResponseCache
+from libs.util.tracing import span
+from typing import Any, Dict, List, Optional
 
 from langchain_core.runnables.base import Runnable
 from langchain_core.language_models.chat_models import BaseChatModel
@@ -9,7 +13,6 @@ from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate
 )
-from langchain_core.output_parsers import StrOutputParser
 
 JUDGE_SYSTEM_PROMPT = """당신은 LLM의 출력 결과를 평가하는 전문가입니다. 주어진 출력(output)과 기준 출력(reference output)을 비교하여, 정확성과 관련성을 기준으로 평가합니다.
 
@@ -36,39 +39,208 @@ JUDGE_USER_PROMPT = """출력: {{output}}
 """
 
 
+PACKED_JUDGE_SYSTEM_PROMPT = """당신은 LLM의 출력 결과를 평가하는 전문가입니다. 번호가 매겨진 여러 항목이 주어지며, 각 항목의 출력(output)과 기준 출력(reference output)을 비교하여 정확성과 관련성을 기준으로 평가합니다.
+
+평가 기준:
+1. **정확성**: 출력이 기준 출력과 동일한 의미 또는 정보를 전달하는가?
+2. **관련성**: 출력이 기준 출력의 의도와 목적에 부합하는가?
+
+평가 결과:
+- 결과는 이진 점수로 표시:
+  - 1: 출력이 기준 출력과 일치하거나 평가 기준을 충족함.
+  - 0: 출력이 기준 출력과 일치하지 않거나 평가 기준을 충족하지 못함.
+
+모든 항목을 빠짐없이 평가하고, 결과는 항목 번호(index)를 포함한 아래 JSON 배열 형식만 따릅니다.
+###
+[
+    {
+        "index": 0,
+        "score": "0 또는 1",
+        "explanation": "점수에 대한 간단한 설명"
+    }
+]
+###
+"""
+
+PACKED_JUDGE_USER_PROMPT = """{{items}}"""
+
+PACKED_JUDGE_ITEM_FORMAT = """[항목 {index}]
+출력: {output}
+기준 출력: {reference_output}
+"""
+
+
+JUDGE_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessagePromptTemplate.from_template(JUDGE_SYSTEM_PROMPT, template_format="jinja2"),
+    HumanMessagePromptTemplate.from_template(JUDGE_USER_PROMPT, template_format="jinja2"),
+])
+
+PACKED_JUDGE_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessagePromptTemplate.from_template(PACKED_JUDGE_SYSTEM_PROMPT, template_format="jinja2"),
+    HumanMessagePromptTemplate.from_template(PACKED_JUDGE_USER_PROMPT, template_format="jinja2"),
+])
+
+
 class LLMJudgeEvaluator(Evaluator):
-    def __init__(self, chain: Runnable, judge_model: BaseChatModel):
-        super().__init__(chain)
+    # 생성 결과가 나오는 대로 judge 호출을 시작할 수 있다.
+    pipelined_scoring = True
+
+    def __init__(self,
+                 chain: Runnable,
+                 judge_model: BaseChatModel,
+                 response_cache: ResponseCache = None,
+                 verbose: bool = False,
+                 pack_size: int = 1,
+                 measure_streaming: bool = False):
+        super().__init__(chain, response_cache, measure_streaming)
         self.judge_model = judge_model
+        self.verbose = verbose
+        # 한 번의 judge 요청에 묶어서 평가할 (output, reference_output) 쌍의 개수
+        self.pack_size = max(1, pack_size)
+        self.judge_chain = JUDGE_PROMPT_TEMPLATE | self.judge_model
+        self.packed_judge_chain = PACKED_JUDGE_PROMPT_TEMPLATE | self.judge_model
+        self.judge_usage = {
+            "calls": 0,
+            "packed_calls": 0,
+            "fallback_items": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "latency": 0.0,
+        }
+
+    def score(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        llm_judge_result = self.llm_judge(result["output"], result["reference_output"])
+        return self._apply_judge_result(result, llm_judge_result)
+
+    async def ascore(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        llm_judge_result = await self.allm_judge(result["output"], result["reference_output"])
+        return self._apply_judge_result(result, llm_judge_result)
+
+    def score_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.pack_size == 1:
+            return super().score_batch(results)
+
+        for pack in self._split_packs(results):
+            response = self._invoke_judge(self.packed_judge_chain, {"items": self._pack_items(pack)}, packed=True)
+            for result in self._apply_packed_judge_result(pack, response):
+                # 파싱에 실패한 항목만 단건 judge 로 다시 평가한다.
+                self.judge_usage["fallback_items"] += 1
+                self.score(result)
+        return results
+
+    async def ascore_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.pack_size == 1:
+            return await super().ascore_batch(results)
+
+        for pack in self._split_packs(results):
+            response = await self._ainvoke_judge(self.packed_judge_chain, {"items": self._pack_items(pack)}, packed=True)
+            for result in self._apply_packed_judge_result(pack, response):
+                self.judge_usage["fallback_items"] += 1
+                await self.ascore(result)
+        return results
+
+    def _split_packs(self, results: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        return [results[i:i + self.pack_size] for i in range(0, len(results), self.pack_size)]
+
+    @staticmethod
+    def _pack_items(pack: List[Dict[str, Any]]) -> str:
+        return "\n".join(
+            PACKED_JUDGE_ITEM_FORMAT.format(index=index, output=result["output"], reference_output=result["reference_output"])
+            for index, result in enumerate(pack)
+        )
+
+    def _apply_packed_judge_result(self, pack: List[Dict[str, Any]], llm_judge_result: str) -> List[Dict[str, Any]]:
+        """ 묶음 응답을 항목별로 나누어 점수를 기록하고, 유효한 결과를 얻지 못한 항목을 반환한다. """
+        if self.verbose:
+            print("===================")
+            print(llm_judge_result)
+            print("===================")
+
+        judged = {}
+        for item in self._parse_json_array(llm_judge_result) or []:
+            try:
+                index = int(item["index"])
+                score = float(item["score"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(pack) and score in (0.0, 1.0):
+                judged[index] = (score, str(item.get("explanation", "")))
 
-    def evaluate(self, input_variables: dict, reference_output: str) -> Dict[str, Any]:
-        result = super().evaluate(input_variables, reference_output)
-        llm_judge_result = self.llm_judge(result["output"], reference_output)
-        print("===================")
-        print(llm_judge_result)
-        print("===================")
+        failed = []
+        for index, result in enumerate(pack):
+            if index in judged:
+                result["score"], result["score_explanation"] = judged[index]
+            else:
+                failed.append(result)
+        return failed
 
+    @staticmethod
+    def _extract_json(text: str, start_token: str, end_token: str) -> Any:
+        # 모델이 JSON 앞뒤에 ### 이나 설명을 덧붙이는 경우가 있어 JSON 부분만 잘라서 파싱한다.
+        start, end = text.find(start_token), text.rfind(end_token)
+        if start == -1 or end <= start:
+            return None
         try:
-            llm_judge_result = json.loads(llm_judge_result)
+            return json.loads(text[start:end + 1])
         except json.JSONDecodeError:
-            llm_judge_result = {"score": -1, "explanation": "LLM judge 결과를 JSON으로 변환하는 중 오류가 발생했습니다."}
+            return None
+
+    def _parse_json_array(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        parsed = self._extract_json(text, "[", "]")
+        if not isinstance(parsed, list):
+            return None
+        return [item for item in parsed if isinstance(item, dict)]
+
+    def _apply_judge_result(self, result: Dict[str, Any], llm_judge_result: str) -> Dict[str, Any]:
+        if self.verbose:
+            print("===================")
+            print(llm_judge_result)
+            print("===================")
+
+        parsed = self._extract_json(llm_judge_result, "{", "}")
+        if not isinstance(parsed, dict):
+            result["score"] = -1.0
+            result["score_explanation"] = "LLM judge 결과를 JSON으로 변환하는 중 오류가 발생했습니다."
+            return result
         try:
-            result["score"] = float(llm_judge_result["score"])
-        except ValueError:
+            result["score"] = float(parsed["score"])
+            result["score_explanation"] = str(parsed.get("explanation", ""))
+        except (KeyError, TypeError, ValueError):
             result["score"] = -1.0
-            result["scroe_explanation"] = "LLM judge 결과의 점수가 유효한 숫자가 아닙니다."
-        result["scroe_explanation"] = llm_judge_result["explanation"]
+            result["score_explanation"] = "LLM judge 결과의 점수가 유효한 숫자가 아닙니다."
         return result
 
     def llm_judge(self, output: str, reference_output: str):
-        prompt_template = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(JUDGE_SYSTEM_PROMPT, template_format="jinja2"),
-            HumanMessagePromptTemplate.from_template(JUDGE_USER_PROMPT, template_format="jinja2"),
-        ])
+        return self._invoke_judge(self.judge_chain, {
+            "output": output,
+            "reference_output": reference_output
+        })
 
-        judge_chain = prompt_template | self.judge_model | StrOutputParser()
-        response = judge_chain.invoke({
+    async def allm_judge(self, output: str, reference_output: str):
+        return await self._ainvoke_judge(self.judge_chain, {
             "output": output,
             "reference_output": reference_output
         })
-        return response
+
+    def _invoke_judge(self, judge_chain: Runnable, inputs: Dict[str, Any], packed: bool = False) -> str:
+        start_time = time.time()
+        with span("judge", packed=packed):
+            response = call_with_retry(judge_chain, lambda: judge_chain.invoke(inputs))
+        self._record_judge_usage(response, time.time() - start_time, packed)
+        return response.content
+
+    async def _ainvoke_judge(self, judge_chain: Runnable, inputs: Dict[str, Any], packed: bool = False) -> str:
+        start_time = time.time()
+        async with span("judge", packed=packed):
+            response = await acall_with_retry(judge_chain, lambda: judge_chain.ainvoke(inputs))
+        self._record_judge_usage(response, time.time() - start_time, packed)
+        return response.content
+
+    def _record_judge_usage(self, response: Any, latency: float, packed: bool):
+        usage_metadata = getattr(response, "usage_metadata", None) or {}
+        self.judge_usage["calls"] += 1
+        if packed:
+            self.judge_usage["packed_calls"] += 1
+        self.judge_usage["input_tokens"] += usage_metadata.get("input_tokens", 0)
+        self.judge_usage["output_tokens"] += usage_metadata.get("output_tokens", 0)
+        self.judge_usage["latency"] += latency
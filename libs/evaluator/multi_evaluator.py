@@ -0,0 +1,63 @@
+import asyncio
+from typing import Any, Dict, List
+
+from langchain_core.runnables.base import Runnable
+
+from libs.evaluator import Evaluator
+from libs.model.response_cache import ResponseCache
+
+
+class MultiEvaluator(Evaluator):
+    """ 체인 출력은 한 번만 생성하고 여러 평가자에게 나누어 채점한다.
+
+    평가자별 점수는 result["scores"] 에 {평가자 이름: 점수} 로 담기고, result["score"] 는 첫 번째 평가자의 점수다.
+    """
+    # 평가자별 score_batch 를 그대로 활용하도록 항상 묶어서 채점한다.
+    batch_scoring = True
+
+    def __init__(self,
+                 chain: Runnable,
+                 evaluators: List[Evaluator],
+                 response_cache: ResponseCache = None,
+                 measure_streaming: bool = False):
+        super().__init__(chain, response_cache, measure_streaming)
+        if not evaluators:
+            raise ValueError("At least one evaluator must be provided for MultiEvaluator")
+        self.evaluators = evaluators
+        # 원격 채점자(LLM judge)가 있으면 생성과 채점을 겹쳐 수행하고, 가장 큰 pack_size 단위로 넘긴다.
+        self.pipelined_scoring = any(evaluator.pipelined_scoring for evaluator in evaluators)
+        self.pack_size = max(evaluator.pack_size for evaluator in evaluators)
+
+    @property
+    def evaluator_names(self) -> List[str]:
+        return [type(evaluator).__name__ for evaluator in self.evaluators]
+
+    def score(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return self.score_batch([result])[0]
+
+    async def ascore(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.ascore_batch([result]))[0]
+
+    def score_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 평가자가 결과 dict 에 점수를 직접 쓰므로 평가자마다 복사본을 넘긴다.
+        scored = [evaluator.score_batch([dict(result) for result in results]) for evaluator in self.evaluators]
+        return self._merge_scores(results, scored)
+
+    async def ascore_batch(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 임베딩 API, judge 모델 등 서로 다른 원격 채점자를 동시에 호출한다.
+        scored = await asyncio.gather(*[
+            evaluator.ascore_batch([dict(result) for result in results]) for evaluator in self.evaluators
+        ])
+        return self._merge_scores(results, scored)
+
+    def _merge_scores(self, results: List[Dict[str, Any]], scored: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        for i, result in enumerate(results):
+            scores = {}
+            for name, evaluator_results in zip(self.evaluator_names, scored):
+                evaluator_result = evaluator_results[i]
+                scores[name] = evaluator_result["score"]
+                # 평가자가 추가한 값(judge 설명 등)도 함께 남긴다.
+                result.update({k: v for k, v in evaluator_result.items() if k not in result and k != "score"})
+            result["scores"] = scores
+            result["score"] = scores[self.evaluator_names[0]]
+        return results
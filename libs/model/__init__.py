@@ -1,5 +1,7 @@
 from .model_provider import ChatModelManager
+from .response_cache import ResponseCache
 
 __all__ = [
     "ChatModelManager",
+    "ResponseCache",
 ]
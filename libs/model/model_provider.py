@@ -1,9 +1,98 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anthropic
+import ollama
 from langchain_anthropic import ChatAnthropic
 from langchain_ollama import ChatOllama
-from typing import Any, Dict, Callable, List
+
+from libs.model.rate_controller import RateController
+from libs.util.lru_cache import LRUCache
+
+# 프로세스에서 재사용하는 모델 인스턴스 수
+MAX_CACHED_MODELS = 16
+# 모델별 호출 한도 (RateController 인자). Anthropic 은 조직의 분당 한도, Ollama 는 서버의 동시 처리 수(OLLAMA_NUM_PARALLEL)에 맞춘다.
+RATE_LIMITS: Dict[str, Dict[str, Any]] = {
+    "claude-3-5-sonnet-20241022": {"requests_per_minute": 50, "tokens_per_minute": 40_000, "max_concurrency": 8},
+    "mistral": {"max_concurrency": 4},
+    "tinyllama": {"max_concurrency": 4},
+}
+# base_url 없이 만든 Ollama 모델이 접속하는 서버 (ollama 클라이언트와 같이 OLLAMA_HOST 를 먼저 사용)
+DEFAULT_OLLAMA_HOST = "localhost:11434"
+
+
+def ollama_host(base_url: Optional[str]) -> str:
+    """ 같은 Ollama 서버를 가리키는 base_url 이 같은 값이 되도록 기본 서버, scheme, 끝의 / 를 맞춘다. """
+    host = (base_url or os.getenv("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST).rstrip("/")
+    return host if "://" in host else f"http://{host}"
+
+
+class _LoopLocalClient:
+    """ 이벤트 루프마다 async 클라이언트를 하나씩 만들어 쓰는 프록시
+
+    httpx.AsyncClient 의 연결은 만든 이벤트 루프에서만 쓸 수 있으므로, asyncio.run 으로 루프가 바뀌면 새 클라이언트를 만든다.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _current(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = self._factory()
+            return client
+
+    async def aclose_loop(self):
+        """ 실행 중인 이벤트 루프에서 만든 클라이언트를 닫는다. """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            await _aclose_client(client)
+
+    def close_all(self):
+        """ 아직 닫히지 않은 루프의 클라이언트를 그 루프에서 닫는다. (이미 닫힌 루프의 연결은 정리할 수 없어 버린다) """
+        with self._lock:
+            clients, self._clients = list(self._clients.items()), weakref.WeakKeyDictionary()
+        for loop, client in clients:
+            if loop.is_closed():
+                continue
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(_aclose_client(client), loop)
+            else:
+                loop.run_until_complete(_aclose_client(client))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._current(), name)
+
+
+def _aclose_client(client: Any) -> Awaitable[None]:
+    # anthropic.AsyncClient 는 close(), ollama.AsyncClient 는 내부 httpx.AsyncClient 를 닫는다.
+    close = getattr(client, "close", None) or getattr(client._client, "aclose")
+    return close()
 
 
 class ChatModelManager:
+    """ 모델 이름과 인자 별로 모델 인스턴스를 재사용하고, 같은 provider/base_url 의 모델은 HTTP 클라이언트(연결 풀)를 공유한다.
+
+    캐시는 프로세스 전체에서 공유되므로 ChatModelManager 를 여러 번 만들어도 같은 인스턴스를 돌려준다.
+    """
+    _models = LRUCache(max_entries=MAX_CACHED_MODELS)
+    # {(provider, base_url, 클라이언트 설정): (sync 클라이언트, async 클라이언트)}
+    _clients: Dict[Tuple, Tuple[Any, Any]] = {}
+    _clients_lock = threading.Lock()
+    # Anthropic 은 (API 키, 모델), Ollama 는 서버(base_url) 단위로 한도를 공유한다.
+    _rate_controllers: Dict[Tuple, RateController] = {}
+
     def __init__(self):
         self.model_map: Dict[str, Callable[..., Any]] = {
             "claude-3-5-sonnet-20241022": self._create_anthropic_claude_sonnet_model,
@@ -13,16 +102,13 @@ class ChatModelManager:
 
         self.model_require_args_map: Dict[str, Dict[str, str]] = {
             "claude-3-5-sonnet-20241022": {"api_key": ""},
-            "mistral": {"base_url": "localhost:11434"},
-            "tinyllama": {"base_url": "localhost:11434"},
+            "mistral": {"base_url": DEFAULT_OLLAMA_HOST},
+            "tinyllama": {"base_url": DEFAULT_OLLAMA_HOST},
         }
 
     def _create_anthropic_claude_sonnet_model(self, **kwargs) -> ChatAnthropic:
         return ChatAnthropic(model="claude-3-5-sonnet-20241022", **kwargs)
 
-    def _create_anthropic_claude_sonnet_model(self, **kwargs) -> ChatAnthropic:
-        return ChatAnthropic(model="claude-3-5-sonnet-20241022", **kwargs)
-
     def _create_mistral_model(self, **kwargs) -> Any:
         if kwargs.get("max_tokens"):
             kwargs["num_predict"] = kwargs["max_tokens"]
@@ -42,7 +128,115 @@ class ChatModelManager:
     def get_model(self, model_name: str, **kwargs) -> Any:
         if model_name not in self.model_map:
             raise ValueError(f"Model '{model_name}' is not supported. Supported models: {list(self.model_map.keys())}")
-        return self.model_map[model_name](**kwargs)
+
+        key = (model_name, self._normalize_kwargs(kwargs))
+        model = self._models.get(key)
+        if model is None:
+            model = self.model_map[model_name](**kwargs)
+            self._share_clients(model)
+            self._attach_rate_controller(model_name, model)
+            self._models.set(key, model)
+        return model
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {"models": len(self._models), "clients": len(self._clients), "hits": self._models.hits, "misses": self._models.misses}
+
+    @classmethod
+    def evict(cls, model_name: Optional[str] = None):
+        """ 캐시된 모델 인스턴스를 지운다. (model_name 이 없으면 전부) 공유 클라이언트는 유지된다. """
+        for key in cls._models.keys():
+            if model_name is None or key[0] == model_name:
+                cls._models.pop(key)
+
+    @classmethod
+    def close(cls):
+        """ 모든 모델을 지우고 공유 HTTP 클라이언트의 연결을 닫는다. """
+        cls.evict()
+        with cls._clients_lock:
+            clients, cls._clients = cls._clients, {}
+        for sync_client, async_client in clients.values():
+            # anthropic.Client 는 close(), ollama.Client 는 내부 httpx.Client 를 닫는다.
+            close = getattr(sync_client, "close", None) or getattr(sync_client._client, "close")
+            close()
+            async_client.close_all()
+
+    @classmethod
+    async def aclose_loop_clients(cls):
+        """ 실행 중인 이벤트 루프에서 만든 async 클라이언트를 닫는다. (asyncio.run 으로 만든 루프가 끝나기 전에 호출) """
+        with cls._clients_lock:
+            clients = list(cls._clients.values())
+        for _, async_client in clients:
+            await async_client.aclose_loop()
+
+    @staticmethod
+    def _normalize_kwargs(kwargs: Dict[str, Any]) -> str:
+        """ 인자 순서와 None 값에 관계없이 같은 설정이면 같은 키가 되도록 직렬화한다. (API 키는 해시로 저장) """
+        normalized = {}
+        for name, value in kwargs.items():
+            if value is None:
+                continue
+            if name == "base_url" and isinstance(value, str):
+                value = value.rstrip("/")
+            if name == "api_key":
+                value = hashlib.sha256(str(value).encode("utf-8")).hexdigest()
+            normalized[name] = value
+        return json.dumps(normalized, sort_keys=True, default=str)
+
+    def _share_clients(self, model: Any):
+        """ 모델이 만든 클라이언트를 같은 설정의 공유 클라이언트로 바꿔서 keep-alive 연결을 재사용한다. """
+        if isinstance(model, ChatAnthropic):
+            params = {
+                "api_key": model.anthropic_api_key.get_secret_value(),
+                "base_url": model.anthropic_api_url,
+                "max_retries": model.max_retries,
+                "default_headers": (model.default_headers or None),
+            }
+            if model.default_request_timeout is None or model.default_request_timeout > 0:
+                params["timeout"] = model.default_request_timeout
+            key = ("anthropic", self._normalize_kwargs(params))
+            model._client, model._async_client = self._get_clients(
+                key, lambda: anthropic.Client(**params), lambda: anthropic.AsyncClient(**params)
+            )
+        elif isinstance(model, ChatOllama):
+            client_kwargs = model.client_kwargs or {}
+            host = ollama_host(model.base_url)
+            key = ("ollama", self._normalize_kwargs({"base_url": host, **client_kwargs}))
+            model._client, model._async_client = self._get_clients(
+                key,
+                lambda: ollama.Client(host=host, **client_kwargs),
+                lambda: ollama.AsyncClient(host=host, **client_kwargs)
+            )
+
+    def get_rate_controller(self, model: Any) -> Optional[RateController]:
+        return model.rate_limiter if isinstance(model.rate_limiter, RateController) else None
+
+    def _attach_rate_controller(self, model_name: str, model: Any):
+        """ 모델 호출 전에 한도를 기다리고(rate_limiter), 호출 결과로 한도를 조절하도록(callbacks) RateController 를 붙인다. """
+        limits = RATE_LIMITS.get(model_name)
+        if limits is None:
+            return
+        if isinstance(model, ChatAnthropic):
+            api_key = hashlib.sha256(model.anthropic_api_key.get_secret_value().encode("utf-8")).hexdigest()
+            key = ("anthropic", api_key, model_name)
+        elif isinstance(model, ChatOllama):
+            key = ("ollama", ollama_host(model.base_url))
+        else:
+            key = (type(model).__name__, model_name)
+
+        with self._clients_lock:
+            controller = self._rate_controllers.get(key)
+            if controller is None:
+                controller = self._rate_controllers[key] = RateController(**limits)
+        model.rate_limiter = controller
+        model.callbacks = list(model.callbacks or []) + [controller]
+
+    @classmethod
+    def _get_clients(cls, key: Tuple, create_sync: Callable[[], Any], create_async: Callable[[], Any]) -> Tuple[Any, Any]:
+        with cls._clients_lock:
+            clients = cls._clients.get(key)
+            if clients is None:
+                clients = cls._clients[key] = (create_sync(), _LoopLocalClient(create_async))
+            return clients
 
 
 if __name__ == '__main__':
@@ -0,0 +1,281 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, TypeVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_core.runnables.base import Runnable
+
+T = TypeVar("T")
+
+# 다시 시도하면 성공할 수 있는 HTTP 상태 코드
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# 제공자가 과부하/한도 초과를 알리는 상태 코드 (동시 실행 수를 줄인다)
+OVERLOAD_STATUS_CODES = {429, 503, 529}
+# 연결 실패, 타임아웃처럼 상태 코드 없이 다시 시도할 수 있는 오류 이름
+RETRYABLE_ERROR_NAMES = {"ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError", "APIConnectionError", "APITimeoutError"}
+
+
+class CallTiming:
+    """ 모델 호출 한 번(재시도 한 번)의 시작 시각. RateController 가 대기를 마치고 자리를 잡은 시각으로 갱신한다. """
+    __slots__ = ("started_at",)
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+
+
+# 호출 쪽에서 만든 CallTiming. 모델이 asyncio.gather 의 task 나 스레드에서 실행되어도 같은 객체를 갱신한다.
+_call_timing: ContextVar[Optional[CallTiming]] = ContextVar("llmops_call_timing", default=None)
+
+
+@contextmanager
+def measure_call() -> Iterator[CallTiming]:
+    """ 안에서 실행한 모델 호출의 시작 시각을 호출 한도 대기 이후로 맞춘다. (재시도마다 새로 측정) """
+    timing = CallTiming()
+    token = _call_timing.set(timing)
+    try:
+        yield timing
+    finally:
+        _call_timing.reset(token)
+
+
+class _TokenBucket:
+    """ 초당 rate 만큼 채워지고 capacity 까지 쌓이는 버킷. 실제 사용량을 나중에 반영할 수 있도록 음수(빚)를 허용한다. """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_seconds(self, amount: float) -> float:
+        # 한 번에 capacity 보다 많이 요청하면 가득 찼을 때 보낸다.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+
+class RateController(BaseRateLimiter, BaseCallbackHandler):
+    """ 분당 요청 수/토큰 수 버킷과 AIMD 동시 실행 제한으로 모델 호출 속도를 조절한다.
+
+    모델의 rate_limiter 와 callbacks 에 함께 등록한다. (ChatModelManager 가 제공자/모델별로 하나씩 붙임)
+    - 호출 전(acquire): 요청/토큰 버킷, retry-after 대기 시간, 동시 실행 수 한도를 모두 만족할 때까지 기다린다.
+    - 호출 후(callback): 실제 토큰 사용량을 버킷에 반영하고, 성공하면 한도를 1/한도 씩 늘리고 429/과부하 오류면 절반으로 줄인다.
+    토큰 버킷은 최근 호출의 평균 토큰 수를 미리 차감하고 응답을 받은 뒤 차이를 보정한다.
+    """
+    # 비동기 호출에서도 콜백을 스레드로 넘기지 않고 바로 실행한다.
+    run_inline = True
+
+    def __init__(self,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 max_concurrency: int = 8,
+                 min_concurrency: int = 1,
+                 burst_seconds: float = 10.0,
+                 estimated_tokens: float = 1000.0,
+                 max_retries: int = 6,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 verbose: bool = False):
+        self.requests = _TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.tokens = _TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.estimated_tokens = estimated_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.verbose = verbose
+
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.stats = {"requests": 0, "errors": 0, "overloads": 0, "retries": 0, "waited_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        start_time = time.monotonic()
+        while True:
+            wait = self._try_acquire()
+            if wait == 0.0:
+                self._record_wait(start_time)
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        start_time = time.monotonic()
+        while True:
+            wait = self._try_acquire()
+            if wait == 0.0:
+                self._record_wait(start_time)
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+
+    def _try_acquire(self) -> float:
+        """ 바로 보낼 수 있으면 자리를 잡고 0, 아니면 다시 확인할 때까지 기다릴 시간을 반환한다. """
+        with self._lock:
+            now = time.monotonic()
+            waits = [self.cooldown_until - now]
+            if self.in_flight >= int(self.concurrency_limit):
+                # 진행 중인 호출이 끝나야 자리가 나므로 짧게 기다렸다가 다시 확인한다.
+                waits.append(0.05)
+            for bucket, amount in [(self.requests, 1.0), (self.tokens, self.estimated_tokens)]:
+                if bucket is not None:
+                    bucket.refill(now)
+                    waits.append(bucket.wait_seconds(amount))
+            wait = max(waits)
+            if wait > 0:
+                return wait
+
+            if self.requests is not None:
+                self.requests.tokens -= 1
+            if self.tokens is not None:
+                self.tokens.tokens -= self.estimated_tokens
+            self.in_flight += 1
+            self.stats["requests"] += 1
+            return 0.0
+
+    def _record_wait(self, start_time: float):
+        with self._lock:
+            self.stats["waited_seconds"] += time.monotonic() - start_time
+        timing = _call_timing.get()
+        if timing is not None:
+            timing.started_at = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> Any:
+        used = _total_tokens(response)
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if used is not None:
+                if self.tokens is not None:
+                    self.tokens.tokens -= used - self.estimated_tokens
+                self.estimated_tokens = 0.8 * self.estimated_tokens + 0.2 * used
+            # additive increase: 한도만큼 성공하면 1 늘어난다.
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> Any:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.stats["errors"] += 1
+            if _status_code(error) in OVERLOAD_STATUS_CODES:
+                # multiplicative decrease, retry-after 가 있으면 그 시간 동안 새 호출을 보내지 않는다.
+                self.stats["overloads"] += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                retry_after = _retry_after(error)
+                if retry_after:
+                    self.cooldown_until = max(self.cooldown_until, time.monotonic() + retry_after)
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """ 다시 시도할 오류면 기다릴 시간을, 아니면 None 을 반환한다. (retry-after 우선, 없으면 full jitter 지수 백오프) """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func: Callable[[], T]) -> T:
+        """ func 를 실행하고, 다시 시도할 수 있는 오류면 retry_delay 만큼 기다렸다가 다시 실행한다. """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self._record_retry(e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, func: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                self._record_retry(e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _record_retry(self, error: BaseException, delay: float):
+        with self._lock:
+            self.stats["retries"] += 1
+        if self.verbose:
+            print(f"Retrying model call in {delay:.1f}s after error: {type(error).__name__}: {error}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats, concurrency_limit=self.concurrency_limit, in_flight=self.in_flight,
+                        estimated_tokens=self.estimated_tokens)
+
+
+def is_retryable(error: BaseException) -> bool:
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def find_rate_controllers(chain: Runnable) -> List[RateController]:
+    """ 체인에 포함된 모델에 붙어 있는 RateController (prompt | model 형태의 체인) """
+    steps = getattr(chain, "steps", None) or [chain]
+    controllers = []
+    for step in steps:
+        if isinstance(step, BaseChatModel) and isinstance(step.rate_limiter, RateController):
+            controllers.append(step.rate_limiter)
+    return controllers
+
+
+def call_with_retry(chain: Runnable, func: Callable[[], T]) -> T:
+    """ 체인의 모델에 RateController 가 있으면 그 재시도 정책으로 func 를 실행한다. """
+    controllers = find_rate_controllers(chain)
+    return controllers[0].call(func) if controllers else func()
+
+
+async def acall_with_retry(chain: Runnable, func: Callable[[], Awaitable[T]]) -> T:
+    controllers = find_rate_controllers(chain)
+    return await (controllers[0].acall(func) if controllers else func())
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # anthropic.APIStatusError, ollama.ResponseError 는 status_code, httpx.HTTPStatusError 는 response.status_code
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _total_tokens(response: LLMResult) -> Optional[int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                return usage_metadata.get("total_tokens") or usage_metadata["input_tokens"] + usage_metadata["output_tokens"]
+    return None
@@ -0,0 +1,69 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables.base import Runnable
+
+from libs.util.secret import DEFAULT_DATABASE_PATH
+from libs.util.sqlite_cache import SQLiteCache
+
+
+class ResponseCache(SQLiteCache):
+    """ 프롬프트 렌더링 결과, 모델 설정, 입력 값이 모두 같은 체인 호출의 응답을 재사용하는 캐시 """
+    table = "response_cache"
+    value_columns = ["OUTPUT", "usage_metadata", "latency"]
+
+    def __init__(self,
+                 database: str = DEFAULT_DATABASE_PATH,
+                 max_entries: int = 100_000,
+                 max_age_seconds: Optional[float] = 7 * 24 * 60 * 60,
+                 bypass: bool = False,
+                 evict_interval: int = 100):
+        # bypass 가 켜져 있으면 캐시를 조회하지 않고 새 응답으로 덮어쓴다.
+        self.bypass = bypass
+        super().__init__(database, max_entries, max_age_seconds, evict_interval)
+
+    @staticmethod
+    def make_key(chain: Runnable, input_variables: Dict[str, Any]) -> Optional[str]:
+        """ prompt | model 형태의 체인에서 캐시 키를 만든다. 키를 만들 수 없는 체인이면 None """
+        prompt_template = None
+        model = None
+        for step in getattr(chain, "steps", []):
+            if isinstance(step, ChatPromptTemplate):
+                prompt_template = step
+            if isinstance(step, BaseChatModel):
+                model = step
+
+        if prompt_template is None or model is None:
+            return None
+
+        try:
+            messages = prompt_template.format_messages(**input_variables)
+        except KeyError:
+            # 프롬프트 변수가 앞 단계(retriever 등)에서 만들어지는 체인은 입력만으로 렌더링할 수 없어 캐시하지 않는다.
+            return None
+        payload = {
+            "messages": [(message.type, message.content) for message in messages],
+            "model_class": type(model).__name__,
+            "model_params": model._identifying_params,
+            "input_variables": input_variables,
+        }
+        serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        if self.bypass:
+            return None
+        return super().get(cache_key)
+
+    def set(self, cache_key: str, output: str, usage_metadata: Dict[str, Any], latency: float):
+        self._put(cache_key, (output, json.dumps(dict(usage_metadata)), latency))
+
+    def _decode(self, row: Tuple) -> Dict[str, Any]:
+        return {
+            "output": row[0],
+            "usage_metadata": json.loads(row[1]),
+            "latency": row[2],
+        }
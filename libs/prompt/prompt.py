@@ -4,18 +4,22 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
 from libs.model.model_provider import ChatModelManager
+from libs.util.database import get_connection
 from libs.util.secret import DEFAULT_DATABASE_PATH
 
 
 class Prompt:
     def __init__(self, prompt_name: str, version_id: int = None, database: str = DEFAULT_DATABASE_PATH):
-
-        self.conn = sqlite3.connect(database)
+        self.database = database
         self.prompt_name = prompt_name
         self.version_id = version_id if version_id else self._get_last_version()
 
         self.system_template, self.user_template = self._get_prompt_by_version()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
     def _get_last_version(self):
         try:
             cursor = self.conn.cursor()
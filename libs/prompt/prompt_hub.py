@@ -1,44 +1,17 @@
 import sqlite3
 
+from libs.util.database import get_connection
 from libs.util.secret import DEFAULT_DATABASE_PATH
 
 
 class PromptHub:
 
     def __init__(self, database: str = DEFAULT_DATABASE_PATH):
-
         self.database = database
-        self._init_database()
-        self.conn = sqlite3.connect(database)
-
-    def _init_database(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS prompts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            prompt_name TEXT NOT NULL UNIQUE,
-            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        conn.commit()
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS prompt_versions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            prompt_id INTEGER NOT NULL,
-            version_id INTEGER NOT NULL,
-            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
-            system_template TEXT,
-            user_template TEXT,
-            changed_details TEXT,
-            FOREIGN KEY (prompt_id) REFERENCES prompts (id) ON DELETE CASCADE
-        )
-        ''')
-
-        conn.commit()
-        conn.close()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
 
     def get_prompt_list(self):
         cursor = self.conn.cursor()
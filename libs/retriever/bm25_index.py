@@ -0,0 +1,144 @@
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# 한글은 음절 bigram, 영문/숫자는 단어 단위로 색인한다.
+_TOKEN_PATTERN = re.compile(r"[가-힣]+|[a-z]+|[0-9]+")
+# SQLite 바인딩 변수 개수 제한(기본 999) 안에서 쿼리 토큰을 사용한다.
+_MAX_QUERY_TERMS = 400
+
+
+def tokenize(text: str) -> List[str]:
+    """ 형태소 분석기 없이 조사/어미가 붙은 단어도 매칭되도록 한글 단어를 음절 bigram 으로 나눈다.
+
+    "자동차보험은" -> ["자동", "동차", "차보", "보험", "험은"]
+    """
+    tokens = []
+    for word in _TOKEN_PATTERN.findall(text.lower()):
+        if "가" <= word[0] <= "힣" and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class BM25Index:
+    """ SQLite 에 저장하는 역색인과 BM25 점수 계산
+
+    postings 는 (term, 블록) 마다 문서 위치/빈도 배열을 BLOB 으로 저장하고, 검색할 때 쿼리 토큰의 행만 읽어 numpy 로 점수를 합산한다.
+    "보험" 처럼 거의 모든 문서에 나오는 토큰도 행 몇 개만 읽으면 되므로 문서 수가 늘어도 검색 시간이 크게 늘지 않는다.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._conn = None
+        self._ids = None
+        self._length_norm = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # 검색은 여러 스레드에서 호출될 수 있고 읽기만 한다.
+            self._conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True, check_same_thread=False)
+        return self._conn
+
+    @classmethod
+    def build(cls, path: str, documents: Iterable[Tuple[int, str]], block_size: int = 10_000, **kwargs) -> "BM25Index":
+        """ (문서 id, 본문) 으로 역색인을 새로 만든다. block_size 개 문서마다 postings 를 기록하므로 메모리 사용량이 일정하다. """
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            CREATE TABLE documents (position INTEGER PRIMARY KEY, id INTEGER NOT NULL, length INTEGER NOT NULL);
+            CREATE TABLE postings (term TEXT NOT NULL, block INTEGER NOT NULL, positions BLOB NOT NULL, tfs BLOB NOT NULL, PRIMARY KEY (term, block)) WITHOUT ROWID;
+            CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+        ''')
+
+        document_frequency: Counter = Counter()
+        position = 0
+        block_number = 0
+        documents_rows = []
+        # {term: ([문서 위치], [빈도])}
+        block: Dict[str, Tuple[List[int], List[int]]] = {}
+        for doc_id, text in documents:
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                positions, tfs = block.setdefault(term, ([], []))
+                positions.append(position)
+                tfs.append(tf)
+            documents_rows.append((position, doc_id, len(tokens)))
+            position += 1
+            if len(documents_rows) >= block_size:
+                cls._write_block(conn, block_number, documents_rows, block, document_frequency)
+                block_number += 1
+                documents_rows, block = [], {}
+        cls._write_block(conn, block_number, documents_rows, block, document_frequency)
+
+        conn.executemany("INSERT INTO terms (term, df) VALUES (?, ?)", document_frequency.items())
+        conn.commit()
+        conn.close()
+        return cls(path, **kwargs)
+
+    @staticmethod
+    def _write_block(conn: sqlite3.Connection, block_number: int, documents_rows, block, document_frequency: Counter):
+        conn.executemany("INSERT INTO documents (position, id, length) VALUES (?, ?, ?)", documents_rows)
+        conn.executemany("INSERT INTO postings (term, block, positions, tfs) VALUES (?, ?, ?, ?)", [
+            (term, block_number, np.asarray(positions, dtype=np.int32).tobytes(), np.asarray(tfs, dtype=np.float32).tobytes())
+            for term, (positions, tfs) in block.items()
+        ])
+        document_frequency.update({term: len(positions) for term, (positions, _) in block.items()})
+
+    def _load_documents(self):
+        """ 문서 id 와 길이 정규화 값(k1 * (1 - b + b * 길이 / 평균 길이))을 한 번만 읽어 둔다. """
+        rows = self.conn.execute("SELECT id, length FROM documents ORDER BY position").fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        lengths = np.array([row[1] for row in rows], dtype=np.float32)
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        self._length_norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """ BM25 점수가 높은 순으로 (문서 id, 점수) 를 반환한다. """
+        query_terms = Counter(tokenize(query))
+        if not query_terms:
+            return []
+        if self._ids is None:
+            self._load_documents()
+        terms = [term for term, _ in query_terms.most_common(_MAX_QUERY_TERMS)]
+
+        placeholders = ", ".join("?" * len(terms))
+        document_frequency = dict(self.conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms).fetchall())
+        if not document_frequency:
+            return []
+
+        documents = len(self._ids)
+        scores = np.zeros(documents, dtype=np.float32)
+        cursor = self.conn.execute(f"SELECT term, positions, tfs FROM postings WHERE term IN ({placeholders})", terms)
+        for term, positions, tfs in cursor:
+            df = document_frequency[term]
+            weight = query_terms[term] * math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            positions = np.frombuffer(positions, dtype=np.int32)
+            tfs = np.frombuffer(tfs, dtype=np.float32)
+            # 한 블록 안에서 문서 위치는 중복되지 않는다.
+            scores[positions] += weight * tfs * (self.k1 + 1) / (tfs + self._length_norm[positions])
+
+        matched = np.count_nonzero(scores)
+        top_k = min(top_k, matched)
+        if top_k == 0:
+            return []
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
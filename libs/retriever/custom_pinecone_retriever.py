@@ -1,16 +1,30 @@
 from __future__ import annotations
 
-from typing import Any, List
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from langchain.schema import Document
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableConfig
 from langchain_ollama import ChatOllama
+from pinecone.exceptions import PineconeException
+from pydantic import PrivateAttr
+from urllib3.exceptions import HTTPError
 
+from libs.retriever.rerank_cache import RerankCache
 from libs.util.document_util import format_docs
-from libs.util.secret import PINECONE_API_KEY
+from libs.util.embedding_cache import EmbeddingCache
+from libs.util.lru_cache import LRUCache
+from libs.util.secret import DEFAULT_DATABASE_PATH, PINECONE_API_KEY
+from libs.util.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 class CustomPineconeRetriever(BaseRetriever):
@@ -21,6 +35,32 @@ class CustomPineconeRetriever(BaseRetriever):
     reranker_model: str
     top_k: int
     top_n: int
+    # 메모리 캐시 크기와 만료 시간 (0 이면 캐시하지 않음)
+    query_cache_size: int = 1024
+    rerank_cache_size: int = 1024
+    cache_ttl_seconds: Optional[float] = 60 * 60
+    # 프로세스를 다시 시작해도 유지되는 SQLite 캐시 (메모리 캐시에 없을 때 조회)
+    embedding_cache: Optional[EmbeddingCache] = None
+    rerank_cache: Optional[RerankCache] = None
+    # 한 번의 inference.embed 호출에 넣는 최대 쿼리 수
+    embed_batch_size: int = 96
+    # 비동기 호출에서 검색, rerank 를 동시에 실행하는 스레드 수
+    max_concurrency: int = 16
+
+    _index: Any = PrivateAttr(default=None)
+    # 비동기 호출에서 임베딩을 기다리는 (쿼리, future)
+    _embed_queue: List[Tuple[str, asyncio.Future]] = PrivateAttr(default_factory=list)
+    # 실행 중인 큐 처리 task (이벤트 루프는 task 를 약하게 참조하므로 끝날 때까지 보관)와 아직 큐를 가져가지 않은 task
+    _flush_tasks: Set[asyncio.Task] = PrivateAttr(default_factory=set)
+    _pending_flush: Optional[asyncio.Task] = PrivateAttr(default=None)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _query_embeddings: LRUCache = PrivateAttr()
+    _reranks: LRUCache = PrivateAttr()
+
+    def model_post_init(self, __context: Any):
+        super().model_post_init(__context)
+        self._query_embeddings = LRUCache(self.query_cache_size, self.cache_ttl_seconds)
+        self._reranks = LRUCache(self.rerank_cache_size, self.cache_ttl_seconds)
 
     @classmethod
     def create(cls, pinecone_api_key: str,
@@ -29,7 +69,13 @@ class CustomPineconeRetriever(BaseRetriever):
                embedding_model: str = "multilingual-e5-large",
                reranker_model: str = "bge-reranker-v2-m3",
                top_k: int = 10,
-               top_n: int = 3
+               top_n: int = 3,
+               query_cache_size: int = 1024,
+               rerank_cache_size: int = 1024,
+               cache_ttl_seconds: Optional[float] = 60 * 60,
+               persist_cache: bool = False,
+               max_concurrency: int = 16,
+               database: str = DEFAULT_DATABASE_PATH
                ) -> CustomPineconeRetriever:
         from pinecone import Pinecone
         client = Pinecone(api_key=pinecone_api_key)
@@ -39,39 +85,170 @@ class CustomPineconeRetriever(BaseRetriever):
                    embedding_model=embedding_model,
                    reranker_model=reranker_model,
                    top_k=top_k,
-                   top_n=top_n)
+                   top_n=top_n,
+                   query_cache_size=query_cache_size,
+                   rerank_cache_size=rerank_cache_size,
+                   cache_ttl_seconds=cache_ttl_seconds,
+                   embedding_cache=EmbeddingCache(database) if persist_cache else None,
+                   rerank_cache=RerankCache(database) if persist_cache else None,
+                   max_concurrency=max_concurrency)
+
+    @property
+    def index(self):
+        """ 쿼리마다 새로 만들지 않고 재사용하는 인덱스 핸들 """
+        if self._index is None:
+            self._index = self.client.Index(self.index_name)
+        return self._index
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="pinecone-retriever")
+        return self._executor
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {
+            "query_embedding": {"hits": self._query_embeddings.hits, "misses": self._query_embeddings.misses},
+            "rerank": {"hits": self._reranks.hits, "misses": self._reranks.misses},
+        }
+        for name, cache in [("query_embedding_persisted", self.embedding_cache), ("rerank_persisted", self.rerank_cache)]:
+            if cache is not None:
+                stats[name] = {"hits": cache.hits, "misses": cache.misses}
+        return stats
+
+    def clear_cache(self):
+        """ 메모리 캐시만 비운다. (SQLite 캐시는 각 캐시의 clear 사용) """
+        self._query_embeddings.clear()
+        self._reranks.clear()
 
     def _embed_query(self, query: str):
         """ Pinecone 내장 임베딩 모델을 사용하여 쿼리 벡터화 """
-        result = self.client.inference.embed(
-            model=self.embedding_model,
-            inputs=[query],
-            parameters={"input_type": "query"}
-        )
-        return result[0].values  # 벡터 값 반환
+        return self._embed_queries([query])[0]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """ 캐시에 없는 쿼리만 embed_batch_size 개씩 한 번의 호출로 벡터화 """
+        vectors: Dict[str, List[float]] = {}
+        if self.query_cache_size:
+            for query in dict.fromkeys(queries):
+                query_vector = self._query_embeddings.get(query)
+                if query_vector is not None:
+                    vectors[query] = query_vector
+
+        # 문서(passage)와 쿼리의 임베딩이 다른 모델이 있어 쿼리용 키를 따로 쓴다.
+        cache_model = f"{self.embedding_model}:query"
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        if missing and self.embedding_cache is not None:
+            for query, cached in self.embedding_cache.get_many(cache_model, missing).items():
+                vectors[query] = cached.tolist()
+            missing = [query for query in missing if query not in vectors]
+
+        for i in range(0, len(missing), self.embed_batch_size):
+            chunk = missing[i:i + self.embed_batch_size]
+            with span("pinecone.embed", queries=len(chunk)):
+                result = self.client.inference.embed(
+                    model=self.embedding_model,
+                    inputs=chunk,
+                    parameters={"input_type": "query"}
+                )
+            embedded = {query: embedding.values for query, embedding in zip(chunk, result)}  # 벡터 값 반환
+            vectors.update(embedded)
+            if self.embedding_cache is not None:
+                self.embedding_cache.set_many(cache_model, embedded)
+
+        if self.query_cache_size:
+            for query in dict.fromkeys(queries):
+                self._query_embeddings.set(query, vectors[query])
+        return [vectors[query] for query in queries]
+
+    async def _aembed_query(self, query: str) -> List[float]:
+        """ 동시에 들어온 비동기 호출의 쿼리를 모아 한 번의 임베딩 호출로 처리한다. """
+        if self.query_cache_size:
+            query_vector = self._query_embeddings.get(query)
+            if query_vector is not None:
+                return query_vector
+
+        future = asyncio.get_running_loop().create_future()
+        self._embed_queue.append((query, future))
+        if self._pending_flush is None:
+            task = self._pending_flush = asyncio.get_running_loop().create_task(self._flush_embed_queue())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._on_flush_done)
+        return await future
+
+    async def _flush_embed_queue(self):
+        # 이번 이벤트 루프 차례에 시작된 다른 호출이 큐에 들어올 때까지 한 번 양보한다.
+        await asyncio.sleep(0)
+        self._pending_flush = None
+        pending, self._embed_queue = self._embed_queue, []
+        try:
+            vectors = await self._run_in_executor(self._embed_queries, [query for query, _ in pending])
+        except BaseException as e:
+            self._fail_futures(pending, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, future), query_vector in zip(pending, vectors):
+            if not future.done():
+                future.set_result(query_vector)
+
+    def _on_flush_done(self, task: asyncio.Task):
+        self._flush_tasks.discard(task)
+        if task is self._pending_flush:
+            # 큐를 가져가기 전에 취소되었으면 기다리던 호출도 함께 취소한다.
+            self._pending_flush = None
+            pending, self._embed_queue = self._embed_queue, []
+            self._fail_futures(pending, asyncio.CancelledError())
+
+    @staticmethod
+    def _fail_futures(pending: List[Tuple[str, asyncio.Future]], error: BaseException):
+        for _, future in pending:
+            if future.done():
+                continue
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
 
     def _retrieve_documents(self, query_vector):
         """ Pinecone에서 벡터 유사도 기반으로 top_k개 문서 검색 """
-        results = self.client.Index(self.index_name).query(
-            namespace=self.namespace,
-            vector=query_vector,
-            top_k=self.top_k,
-            include_metadata=True
-        )
+        with span("pinecone.query", top_k=self.top_k):
+            results = self.index.query(
+                namespace=self.namespace,
+                vector=query_vector,
+                top_k=self.top_k,
+                include_metadata=True
+            )
 
         return [{"id": match["id"], "text": match["metadata"]["text"]} for match in results["matches"]]
 
-    def _rerank_documents(self, query, documents):
+    def _rerank_documents(self, query, documents) -> List[Dict[str, Any]]:
         """ Reranker를 사용하여 문서를 재정렬하고 최적의 top_n 선택 """
-        result = self.client.inference.rerank(
-            model=self.reranker_model,
-            query=query,
-            documents=documents,
-            top_n=self.top_n,
-            return_documents=True,
-            parameters={"truncate": "END"}
-        )
-        return result.data
+        # 후보 문서가 같을 때만 재사용하므로 인덱스가 갱신되면 다시 rerank 한다.
+        cache_key = RerankCache.make_key(self.reranker_model, query, documents, self.top_n)
+        reranked = self._reranks.get(cache_key) if self.rerank_cache_size else None
+        if reranked is not None:
+            return reranked
+
+        if self.rerank_cache is not None:
+            reranked = self.rerank_cache.get(cache_key)
+
+        if reranked is None:
+            with span("pinecone.rerank", documents=len(documents)):
+                result = self.client.inference.rerank(
+                    model=self.reranker_model,
+                    query=query,
+                    documents=documents,
+                    top_n=self.top_n,
+                    return_documents=True,
+                    parameters={"truncate": "END"}
+                )
+            reranked = [{"id": doc.document.id, "text": doc.document.text, "score": doc.score} for doc in result.data]
+            if self.rerank_cache is not None:
+                self.rerank_cache.set(cache_key, reranked)
+
+        if self.rerank_cache_size:
+            self._reranks.set(cache_key, reranked)
+        return reranked
 
     def _get_relevant_documents(
             self, query: str, *, run_manager: CallbackManagerForRetrieverRun
@@ -81,7 +258,58 @@ class CustomPineconeRetriever(BaseRetriever):
         reranked_docs = self._rerank_documents(query, retrieved_docs)  # Reranker 적용
 
         # 최종 문서 반환
-        return [Document(page_content=doc.document.text, metadata={"id": doc.document.id}) for doc in reranked_docs]
+        return self._to_documents(reranked_docs)
+
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_vector = await self._aembed_query(query)
+        # Pinecone 클라이언트는 동기 API 만 있어 검색과 rerank 는 스레드에서 실행한다. (연결 풀은 공유)
+        retrieved_docs = await self._run_in_executor(self._retrieve_documents, query_vector)
+        reranked_docs = await self._run_in_executor(self._rerank_documents, query, retrieved_docs)
+        return self._to_documents(reranked_docs)
+
+    def _run_in_executor(self, func, *args):
+        # 스레드에서도 호출한 쪽의 contextvar(현재 trace span 등)를 사용하도록 컨텍스트를 복사해서 실행한다.
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self.executor, lambda: context.run(func, *args))
+
+    def batch(self, inputs: List[str], config: Optional[Union[RunnableConfig, List[RunnableConfig]]] = None, *,
+              return_exceptions: bool = False, **kwargs: Any) -> List[List[Document]]:
+        """ 쿼리 임베딩을 한 번에 미리 계산한 뒤, 검색과 rerank 는 쿼리별로 동시에 실행한다. (max_concurrency 설정 사용) """
+        results = []
+        for chunk, chunk_config in self._prefetch_chunks(inputs, config):
+            self._prefetch_embeddings(chunk)
+            results.extend(super().batch(chunk, chunk_config, return_exceptions=return_exceptions, **kwargs))
+        return results
+
+    async def abatch(self, inputs: List[str], config: Optional[Union[RunnableConfig, List[RunnableConfig]]] = None, *,
+                     return_exceptions: bool = False, **kwargs: Any) -> List[List[Document]]:
+        results = []
+        for chunk, chunk_config in self._prefetch_chunks(inputs, config):
+            await self._run_in_executor(self._prefetch_embeddings, chunk)
+            results.extend(await super().abatch(chunk, chunk_config, return_exceptions=return_exceptions, **kwargs))
+        return results
+
+    def _prefetch_chunks(self, inputs: List[str], config):
+        # 미리 계산한 임베딩이 사용되기 전에 밀려나지 않도록 쿼리 캐시 크기 단위로 나눈다.
+        chunk_size = self.query_cache_size or len(inputs) or 1
+        for i in range(0, len(inputs), chunk_size):
+            chunk_config = config[i:i + chunk_size] if isinstance(config, list) else config
+            yield inputs[i:i + chunk_size], chunk_config
+
+    def _prefetch_embeddings(self, queries: List[str]):
+        if not self.query_cache_size:
+            return
+        try:
+            self._embed_queries(queries)
+        except (PineconeException, HTTPError, OSError) as e:
+            # API/네트워크 오류면 쿼리별 호출에서 다시 임베딩하고 오류도 쿼리별로 전달된다.
+            logger.warning("Failed to prefetch query embeddings: %s", e)
+
+    @staticmethod
+    def _to_documents(reranked_docs: List[Dict[str, Any]]) -> List[Document]:
+        return [Document(page_content=doc["text"], metadata={"id": doc["id"]}) for doc in reranked_docs]
 
 if __name__ == '__main__':
     # 1. Custom Retriever 을 통해 문서 검색
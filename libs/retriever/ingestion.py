@@ -0,0 +1,291 @@
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from libs.util.database import get_connection
+from libs.util.embedding_cache import EmbeddingCache
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+# SQLite 바인딩 변수 개수 제한(기본 999)을 넘지 않도록 IN 절을 나누어 조회
+_QUERY_CHUNK_SIZE = 500
+# Pinecone delete 요청 하나에 넣을 수 있는 최대 id 수
+_DELETE_BATCH_SIZE = 1000
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, text: str) -> str:
+    """ 같은 문서(root 기준 경로)의 같은 내용이면 문서 안에서 위치가 바뀌어도 같은 id 가 된다. """
+    return hashlib.sha256(f"{source}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def load_pdf_chunks(path: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    """ PDF 를 페이지 단위로 읽어 하나의 문서로 합친 뒤 청크로 나눈다. (프로세스 풀에서 실행) """
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text = "".join(page.page_content for page in PyPDFLoader(path).lazy_load())
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.split_text(text)
+
+
+class IngestionPipeline:
+    """ 문서 파일을 청크로 나누어 임베딩하고 벡터 인덱스에 upsert 한다.
+
+    파일 해시와 청크 id 를 SQLite 에 저장해 두고, 바뀌지 않은 파일은 파싱하지 않고 이미 올린 청크는 다시 임베딩하지 않는다.
+    파싱은 프로세스 풀에서 동시에 수행하고, 임베딩/upsert 는 embed_batch_size 개씩 흘려보내므로 메모리 사용량은 코퍼스 크기와 관계없다.
+    파일에서 사라진 청크는 인덱스에서도 지운다.
+    파일은 root 기준 상대 경로로 구분하므로 코퍼스 디렉터리를 옮기거나 다시 받아도 root 만 맞추면 다시 임베딩하지 않는다.
+    """
+
+    def __init__(self,
+                 collection: str,
+                 embed: Callable[[List[str]], List[List[float]]],
+                 upsert: Callable[[List[Dict[str, Any]]], None],
+                 delete: Optional[Callable[[List[str]], None]] = None,
+                 database: str = DEFAULT_DATABASE_PATH,
+                 chunk_size: int = 500,
+                 chunk_overlap: int = 100,
+                 embed_batch_size: int = 96,
+                 upsert_batch_size: int = 100,
+                 max_workers: Optional[int] = None,
+                 loader: Callable[[str, int, int], List[str]] = load_pdf_chunks,
+                 root: Optional[str] = None):
+        """ collection: 인덱스/네임스페이스 구분 키 (같은 파일을 여러 인덱스에 올릴 수 있음)
+        root: 코퍼스 디렉터리 (없으면 현재 디렉터리). 수집 상태와 청크 id 는 이 디렉터리 기준 상대 경로로 저장된다.
+        """
+        self.collection = collection
+        self.embed = embed
+        self.upsert = upsert
+        self.delete = delete
+        self.database = database
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.loader = loader
+        self.root = os.path.abspath(root or os.curdir)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
+    @classmethod
+    def for_pinecone(cls,
+                     client: Any,
+                     index_name: str,
+                     namespace: str,
+                     embedding_model: str = "multilingual-e5-large",
+                     embedding_cache: Optional[EmbeddingCache] = None,
+                     **kwargs) -> "IngestionPipeline":
+        """ Pinecone 내장 임베딩 모델로 임베딩하고 Pinecone 인덱스에 저장하는 파이프라인 """
+        index = client.Index(index_name)
+
+        def embed(texts: List[str]) -> List[List[float]]:
+            # 다른 인덱스에 이미 올린 같은 본문은 캐시된 임베딩을 사용한다.
+            cache_model = f"{embedding_model}:passage"
+            vectors = {text: vector.tolist() for text, vector in embedding_cache.get_many(cache_model, texts).items()} \
+                if embedding_cache is not None else {}
+            missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+            if missing:
+                result = client.inference.embed(
+                    model=embedding_model,
+                    inputs=missing,
+                    parameters={"input_type": "passage", "truncate": "END"}
+                )
+                embedded = {text: embedding.values for text, embedding in zip(missing, result)}
+                vectors.update(embedded)
+                if embedding_cache is not None:
+                    embedding_cache.set_many(cache_model, embedded)
+            return [vectors[text] for text in texts]
+
+        def delete(ids: List[str]):
+            for i in range(0, len(ids), _DELETE_BATCH_SIZE):
+                index.delete(ids=ids[i:i + _DELETE_BATCH_SIZE], namespace=namespace)
+
+        return cls(
+            collection=f"pinecone/{index_name}/{namespace}",
+            embed=embed,
+            upsert=lambda records: index.upsert(vectors=records, namespace=namespace),
+            delete=delete,
+            **kwargs
+        )
+
+    def ingest(self, paths: Iterable[str], progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """ 파일들을 인덱스에 반영하고 처리 통계를 반환한다. (읽지 못한 파일은 failures 에 {source, error} 로 기록) """
+        stats = {
+            "files": 0,
+            "skipped_files": 0,
+            "failed_files": 0,
+            "failures": [],
+            "chunks": 0,
+            "embedded_chunks": 0,
+            "skipped_chunks": 0,
+            "deleted_chunks": 0,
+        }
+        start_time = time.perf_counter()
+
+        # 임베딩을 기다리는 청크 (chunk_id, source, text)
+        buffer: List[Tuple[str, str, str]] = []
+        # 파싱이 끝났지만 아직 upsert 되지 않은 청크가 남은 파일 {source: [file_hash, 전체 chunk_id, 남은 청크 수]}
+        pending_files: Dict[str, List[Any]] = {}
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # 파싱 결과가 쌓이지 않도록 동시에 제출하는 파일 수를 제한한다.
+            in_flight: Dict[Future, Tuple[str, str]] = {}
+            for path in paths:
+                source = self._source(path)
+                stats["files"] += 1
+                current_hash = file_hash(path)
+                if self._is_ingested(source, current_hash):
+                    stats["skipped_files"] += 1
+                    continue
+
+                in_flight[executor.submit(self.loader, os.path.abspath(path), self.chunk_size, self.chunk_overlap)] = (source, current_hash)
+                if len(in_flight) >= self.max_workers * 2:
+                    self._drain(in_flight, buffer, pending_files, stats)
+                if progress_callback:
+                    progress_callback(dict(stats))
+
+            while in_flight:
+                self._drain(in_flight, buffer, pending_files, stats)
+
+        if buffer:
+            self._flush(buffer, pending_files, stats)
+        stats["elapsed_seconds"] = time.perf_counter() - start_time
+        if progress_callback:
+            progress_callback(dict(stats))
+        return stats
+
+    def remove(self, path: str) -> int:
+        """ 파일의 청크를 인덱스와 수집 상태에서 지운다. """
+        source = self._source(path)
+        chunk_ids = list(self._stored_chunk_ids(source))
+        if chunk_ids and self.delete is not None:
+            self.delete(chunk_ids)
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM ingested_chunks WHERE collection = ? AND source = ?", (self.collection, source))
+        cursor.execute("DELETE FROM ingested_files WHERE collection = ? AND source = ?", (self.collection, source))
+        self.conn.commit()
+        return len(chunk_ids)
+
+    def _source(self, path: str) -> str:
+        # 운영체제와 관계없이 같은 키가 되도록 / 로 구분한다.
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def _drain(self, in_flight, buffer, pending_files, stats):
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            source, current_hash = in_flight.pop(future)
+            try:
+                texts = future.result()
+            except Exception as e:
+                # 다른 파일은 계속 수집하고, 실패한 파일은 수집 상태에 남기지 않아 다음 실행에서 다시 시도한다.
+                stats["failed_files"] += 1
+                stats["failures"].append({"source": source, "error": f"{type(e).__name__}: {e}"})
+                continue
+
+            chunks = {chunk_id(source, text): text for text in texts}
+            stored = self._stored_chunk_ids(source)
+            new_chunks = [(cid, source, text) for cid, text in chunks.items() if cid not in stored]
+            stats["chunks"] += len(chunks)
+            stats["skipped_chunks"] += len(chunks) - len(new_chunks)
+
+            pending_files[source] = [current_hash, set(chunks), len(new_chunks)]
+            if not new_chunks:
+                self._finish_file(source, pending_files.pop(source), stats)
+                continue
+
+            buffer.extend(new_chunks)
+            while len(buffer) >= self.embed_batch_size:
+                batch, buffer[:] = buffer[:self.embed_batch_size], buffer[self.embed_batch_size:]
+                self._flush(batch, pending_files, stats)
+
+    def _flush(self, batch: List[Tuple[str, str, str]], pending_files: Dict[str, List[Any]], stats: Dict[str, Any]):
+        vectors = self.embed([text for _, _, text in batch])
+        records = [
+            {"id": cid, "values": vector, "metadata": {"text": text, "source": os.path.basename(source)}}
+            for (cid, source, text), vector in zip(batch, vectors)
+        ]
+        for i in range(0, len(records), self.upsert_batch_size):
+            self.upsert(records[i:i + self.upsert_batch_size])
+
+        # upsert 가 끝난 청크만 기록하므로 중간에 실패해도 다음 실행에서 남은 청크부터 이어서 올린다.
+        now = time.time()
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO ingested_chunks (collection, chunk_id, source, ingested_at) VALUES (?, ?, ?, ?)",
+            [(self.collection, cid, source, now) for cid, source, _ in batch]
+        )
+        self.conn.commit()
+        stats["embedded_chunks"] += len(batch)
+
+        for _, source, _ in batch:
+            pending_files[source][2] -= 1
+        for source in [source for source, state in pending_files.items() if state[2] == 0]:
+            self._finish_file(source, pending_files.pop(source), stats)
+
+    def _finish_file(self, source: str, state: List[Any], stats: Dict[str, Any]):
+        """ 파일의 새 청크가 모두 올라간 뒤 사라진 청크를 지우고 파일 해시를 기록한다. """
+        current_hash, chunk_ids, _ = state
+        stale = [cid for cid in self._stored_chunk_ids(source) if cid not in chunk_ids]
+        if stale and self.delete is not None:
+            self.delete(stale)
+
+        cursor = self.conn.cursor()
+        for i in range(0, len(stale), _QUERY_CHUNK_SIZE):
+            chunk = stale[i:i + _QUERY_CHUNK_SIZE]
+            cursor.execute(
+                f"DELETE FROM ingested_chunks WHERE collection = ? AND chunk_id IN ({','.join('?' * len(chunk))})",
+                (self.collection, *chunk)
+            )
+        cursor.execute('''
+            INSERT OR REPLACE INTO ingested_files (collection, source, file_hash, chunks, ingested_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (self.collection, source, current_hash, len(chunk_ids), time.time()))
+        self.conn.commit()
+        stats["deleted_chunks"] += len(stale)
+
+    def _is_ingested(self, source: str, current_hash: str) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT file_hash FROM ingested_files WHERE collection = ? AND source = ?",
+            (self.collection, source)
+        )
+        row = cursor.fetchone()
+        return row is not None and row[0] == current_hash
+
+    def _stored_chunk_ids(self, source: str) -> Set[str]:
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT chunk_id FROM ingested_chunks WHERE collection = ? AND source = ?",
+            (self.collection, source)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+if __name__ == '__main__':
+    import glob
+
+    from pinecone import Pinecone
+
+    from libs.util.secret import PINECONE_API_KEY
+
+    # dataset 의 보험 상품 요약서를 insurance 인덱스에 반영한다. 다시 실행하면 바뀐 파일만 처리한다.
+    pipeline = IngestionPipeline.for_pinecone(
+        client=Pinecone(api_key=PINECONE_API_KEY),
+        index_name="insurance",
+        namespace="insurance-namespace",
+        root="dataset",
+    )
+    print(pipeline.ingest(sorted(glob.glob("dataset/*.pdf"))))
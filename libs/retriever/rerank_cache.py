@@ -0,0 +1,29 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+from libs.util.sqlite_cache import SQLiteCache
+
+
+class RerankCache(SQLiteCache):
+    """ (reranker 모델, 쿼리, 후보 문서 집합, top_n) 이 같은 rerank 결과를 재사용하는 캐시 """
+    table = "rerank_cache"
+    value_columns = ["result"]
+
+    @staticmethod
+    def make_key(model: str, query: str, documents: List[Dict[str, Any]], top_n: int) -> str:
+        """ 후보 문서는 순서와 관계없이 (id, 본문) 집합으로 비교한다. 인덱스 내용이 바뀌면 다른 키가 된다. """
+        payload = {
+            "model": model,
+            "query": query,
+            "documents": sorted((doc["id"], doc["text"]) for doc in documents),
+            "top_n": top_n,
+        }
+        serialized = json.dumps(payload, ensure_ascii=False)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def set(self, cache_key: str, result: List[Dict[str, Any]]):
+        self._put(cache_key, (json.dumps(result, ensure_ascii=False),))
+
+    def _decode(self, row: Tuple) -> List[Dict[str, Any]]:
+        return json.loads(row[0])
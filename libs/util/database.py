@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+from libs.util.migration import migrate
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+# 다른 연결이 쓰기 잠금을 잡고 있을 때 바로 실패하지 않고 기다리는 시간
+BUSY_TIMEOUT_SECONDS = 30
+# 음수는 KiB 단위 (64MB)
+CACHE_SIZE_KIB = 64 * 1024
+
+_local = threading.local()
+_initialized_databases = set()
+_init_lock = threading.Lock()
+
+
+def get_connection(database: str = DEFAULT_DATABASE_PATH) -> sqlite3.Connection:
+    """ 스레드별로 재사용되는 연결을 반환한다. 처음 연결하는 데이터베이스는 최신 스키마로 마이그레이션한다. """
+    database = os.path.abspath(database)
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(database)
+    if conn is None:
+        conn = _connect(database)
+        connections[database] = conn
+
+    if database not in _initialized_databases:
+        with _init_lock:
+            if database not in _initialized_databases:
+                migrate(conn)
+                _initialized_databases.add(database)
+
+    return conn
+
+
+def _connect(database: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(database, timeout=BUSY_TIMEOUT_SECONDS)
+    # WAL 모드에서는 읽기와 쓰기가 서로를 막지 않는다. (journal_mode 는 데이터베이스 파일에 유지된다)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL 과 함께 쓰면 커밋마다 fsync 하지 않아도 데이터베이스가 손상되지 않는다.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_SECONDS * 1000}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def close_connections():
+    """ 현재 스레드에서 열어둔 연결을 모두 닫는다. """
+    connections = getattr(_local, "connections", None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
@@ -0,0 +1,70 @@
+import hashlib
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from libs.util.database import get_connection
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+# SQLite 바인딩 변수 개수 제한(기본 999)을 넘지 않도록 IN 절을 나누어 조회
+_QUERY_CHUNK_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """ (임베딩 모델, 텍스트 해시) 를 키로 임베딩 벡터를 저장하는 캐시 """
+
+    def __init__(self, database: str = DEFAULT_DATABASE_PATH):
+        self.database = database
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
+    def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        hashes = {text_hash(text): text for text in texts}
+        found = {}
+        cursor = self.conn.cursor()
+        keys = list(hashes.keys())
+        for i in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[i:i + _QUERY_CHUNK_SIZE]
+            cursor.execute(
+                f"SELECT text_hash, embedding FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                (model, *chunk)
+            )
+            for row in cursor.fetchall():
+                found[hashes[row[0]]] = np.frombuffer(row[1], dtype=np.float32)
+
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def set_many(self, model: str, embeddings: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for text, embedding in embeddings.items():
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((model, text_hash(text), vector.shape[0], vector.tobytes(), now))
+
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO embedding_cache (model, text_hash, dimension, embedding, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        self.conn.commit()
+
+    def clear(self, model: str = None):
+        cursor = self.conn.cursor()
+        if model:
+            cursor.execute("DELETE FROM embedding_cache WHERE model = ?", (model,))
+        else:
+            cursor.execute("DELETE FROM embedding_cache")
+        self.conn.commit()
@@ -0,0 +1,78 @@
+import ast
+import json
+import math
+from typing import Any, Optional
+
+# 마이그레이션 전 str(dict) 값에 들어 있던 numpy 스칼라 repr (예: np.float64(0.5))
+_NUMPY_PREFIXES = ("np", "numpy")
+_NON_FINITE_NAMES = ("nan", "inf")
+
+
+def encode_json(value: Optional[Any]) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return json.dumps(value, ensure_ascii=False, allow_nan=False, default=_to_builtin)
+    except ValueError:
+        # SQLite JSON 함수는 NaN/Infinity 를 읽지 못하므로 null 로 저장한다.
+        return json.dumps(_replace_non_finite(value), ensure_ascii=False, default=_to_builtin)
+
+
+def decode_json(value: Optional[str]) -> Optional[Any]:
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        # 마이그레이션 전 str(dict) 형식으로 저장된 값
+        return parse_python_literal(value)
+
+
+def parse_python_literal(value: str) -> Any:
+    """ str(dict) 로 저장된 값을 읽는다. np.float64(x) 같은 numpy repr 은 값으로, nan/inf 는 None 으로 바꾼다. """
+    tree = _LegacyReprTransformer().visit(ast.parse(value.strip(), mode="eval"))
+    return ast.literal_eval(tree)
+
+
+def _to_builtin(value: Any) -> Any:
+    # numpy 스칼라/배열 (numpy 를 import 하지 않고 처리)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _replace_non_finite(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _replace_non_finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite(v) for v in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class _LegacyReprTransformer(ast.NodeTransformer):
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) \
+                and func.value.id in _NUMPY_PREFIXES and len(node.args) == 1:
+            return self.visit(node.args[0])
+        return self.generic_visit(node)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        # -inf
+        operand = self.visit(node.operand)
+        if isinstance(operand, ast.Constant) and operand.value is None:
+            return operand
+        node.operand = operand
+        return node
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in _NON_FINITE_NAMES:
+            return ast.Constant(value=None)
+        return node
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """ 최대 개수와 만료 시간을 갖는 메모리 캐시. 가득 차면 가장 오래 사용되지 않은 항목부터 지운다. (스레드 안전) """
+
+    def __init__(self, max_entries: int = 1024, max_age_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+
+        self.hits = 0
+        self.misses = 0
+        # {key: (저장 시각, 값)}
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.max_age_seconds is not None \
+                    and time.monotonic() - entry[0] > self.max_age_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry is not None else None
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
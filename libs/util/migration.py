@@ -0,0 +1,394 @@
+import sqlite3
+from typing import Callable, List, Union
+
+from libs.util.json_util import decode_json, encode_json
+
+MigrationStep = Union[str, Callable[[sqlite3.Cursor], None]]
+
+
+class Migration:
+    """ 순서대로 한 번만 적용되는 스키마 변경. 적용된 버전은 PRAGMA user_version 에 기록된다. """
+
+    def __init__(self, version: int, description: str, steps: List[MigrationStep]):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+    def apply(self, cursor: sqlite3.Cursor):
+        for step in self.steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+
+
+def add_column(table: str, column: str, column_type: str) -> Callable[[sqlite3.Cursor], None]:
+    """ 컬럼이 없을 때만 추가하는 마이그레이션 단계 (마이그레이션 도입 전에 컬럼이 추가된 데이터베이스 대응) """
+    def step(cursor: sqlite3.Cursor):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return step
+
+
+def convert_to_json(table: str, columns: List[str], batch_size: int = 1000) -> Callable[[sqlite3.Cursor], None]:
+    """ str(dict) 형식으로 저장된 기존 값을 JSON 형식으로 변환하는 마이그레이션 단계 """
+    invalid = " OR ".join(f"({column} IS NOT NULL AND NOT json_valid({column}))" for column in columns)
+
+    def step(cursor: sqlite3.Cursor):
+        last_id = 0
+        while True:
+            cursor.execute(
+                f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ? AND ({invalid}) ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                [tuple(_to_json(value) for value in row[1:]) + (row[0],) for row in rows]
+            )
+            last_id = rows[-1][0]
+    return step
+
+
+def _to_json(value: str) -> str:
+    if value is None:
+        return None
+    try:
+        return encode_json(decode_json(value))
+    except (ValueError, SyntaxError):
+        # 읽을 수 없는 값은 잃어버리지 않도록 JSON 문자열로 보관한다.
+        return encode_json(value)
+
+
+def _rebuild_evaluation_rollups(cursor: sqlite3.Cursor):
+    # 롤업 계산은 평가 모듈에 있으므로 마이그레이션이 실행될 때만 불러온다.
+    from libs.evaluation.rollup import rebuild_rollups
+    rebuild_rollups(cursor)
+
+
+def json_column(source: str, path: str) -> str:
+    """ JSON 컬럼 값을 꺼내는 생성 컬럼 식 (JSON 이 아닌 값이 남아 있어도 조회가 실패하지 않도록 NULL 처리) """
+    return f"(CASE WHEN json_valid({source}) THEN json_extract({source}, '{path}') END)"
+
+
+LATENCY_P50_PATH = '$."50%"'
+LATENCY_P99_PATH = '$."99%"'
+
+MIGRATIONS = [
+    Migration(1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS datasets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            NAME TEXT UNIQUE NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dataset_id INTEGER NOT NULL,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            input_variables TEXT NOT NULL,
+            reference_output TEXT,
+            metadata TEXT,
+            FOREIGN KEY (dataset_id) REFERENCES datasets(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prompt_name TEXT NOT NULL UNIQUE,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS prompt_versions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prompt_id INTEGER NOT NULL,
+            version_id INTEGER NOT NULL,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            system_template TEXT,
+            user_template TEXT,
+            changed_details TEXT,
+            FOREIGN KEY (prompt_id) REFERENCES prompts (id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS evaluations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            evaluation_type TEXT NOT NULL,
+            metadata TEXT,
+            token_usage TEXT NOT NULL,
+            latency TEXT NOT NULL,
+            score REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS evaluation_details (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            evaluation_id INTEGER NOT NULL,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            input_variables TEXT NOT NULL,
+            OUTPUT TEXT NOT NULL,
+            reference_output TEXT,
+            input_token INTEGER,
+            output_token INTEGER,
+            latency REAL,
+            metadata TEXT,
+            score REAL NOT NULL,
+            FOREIGN KEY (evaluation_id) REFERENCES evaluations(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            OUTPUT TEXT NOT NULL,
+            usage_metadata TEXT NOT NULL,
+            latency REAL NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            dimension INTEGER NOT NULL,
+            embedding BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        )
+        ''',
+    ]),
+    Migration(2, "evaluation status and entry index", [
+        add_column("evaluations", "status", "TEXT"),
+        add_column("evaluation_details", "entry_index", "INTEGER"),
+        # status 컬럼이 생기기 전에는 평가가 끝난 뒤에만 evaluations 행을 저장했으므로 status 가 없는 행은 완료된 평가다.
+        "UPDATE evaluations SET status = 'completed' WHERE status IS NULL",
+    ]),
+    Migration(3, "secondary indexes and unique prompt versions", [
+        "CREATE INDEX IF NOT EXISTS idx_data_dataset_id ON data (dataset_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluation_details_evaluation_id ON evaluation_details (evaluation_id, entry_index)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_timestamp ON evaluations (TIMESTAMP)",
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_last_accessed ON response_cache (last_accessed)",
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_created_at ON response_cache (created_at)",
+        # 중복된 (prompt_id, version_id) 가 있으면 먼저 저장된 버전만 남긴다. (Prompt 조회 시에도 먼저 저장된 행이 사용됨)
+        '''
+        DELETE FROM prompt_versions WHERE id NOT IN (
+            SELECT MIN(id) FROM prompt_versions GROUP BY prompt_id, version_id
+        )
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_prompt_versions_prompt_version ON prompt_versions (prompt_id, version_id)",
+    ]),
+    Migration(4, "dataset entries as JSON", [
+        convert_to_json("data", ["input_variables", "metadata"]),
+    ]),
+    Migration(5, "evaluation results as JSON with generated columns", [
+        convert_to_json("evaluations", ["metadata", "token_usage", "latency"]),
+        convert_to_json("evaluation_details", ["input_variables", "metadata"]),
+        f"ALTER TABLE evaluations ADD COLUMN model TEXT GENERATED ALWAYS AS {json_column('metadata', '$.model')} VIRTUAL",
+        f"ALTER TABLE evaluations ADD COLUMN prompt TEXT GENERATED ALWAYS AS {json_column('metadata', '$.prompt')} VIRTUAL",
+        f"ALTER TABLE evaluations ADD COLUMN prompt_version_id INTEGER GENERATED ALWAYS AS {json_column('metadata', '$.prompt_version_id')} VIRTUAL",
+        f"ALTER TABLE evaluations ADD COLUMN dataset TEXT GENERATED ALWAYS AS {json_column('metadata', '$.dataset')} VIRTUAL",
+        f"ALTER TABLE evaluations ADD COLUMN latency_p50 REAL GENERATED ALWAYS AS {json_column('latency', LATENCY_P50_PATH)} VIRTUAL",
+        f"ALTER TABLE evaluations ADD COLUMN latency_p99 REAL GENERATED ALWAYS AS {json_column('latency', LATENCY_P99_PATH)} VIRTUAL",
+        # 집계에 쓰는 값까지 인덱스에 담아서 JSON 을 다시 파싱하지 않고 인덱스만 읽도록 한다.
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_model ON evaluations (model, TIMESTAMP, status, score, latency_p50, latency_p99)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_prompt ON evaluations (prompt, prompt_version_id, TIMESTAMP, status, score, latency_p50, latency_p99)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_dataset ON evaluations (dataset, TIMESTAMP, status, score, latency_p50, latency_p99)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_latency_p99 ON evaluations (latency_p99)",
+    ]),
+    Migration(6, "evaluation rollups", [
+        # 평가자마다 점수의 의미가 다르므로 롤업을 evaluation_type 별로 나눈다.
+        '''
+        CREATE TABLE IF NOT EXISTS evaluation_rollups (
+            evaluation_type TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            prompt_version_id INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            dataset TEXT NOT NULL,
+            day TEXT NOT NULL,
+            TIMESTAMP DATETIME DEFAULT CURRENT_TIMESTAMP,
+            evaluations INTEGER NOT NULL,
+            entries INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            token_usage_sketch TEXT NOT NULL,
+            latency_sketch TEXT NOT NULL,
+            PRIMARY KEY (evaluation_type, prompt, prompt_version_id, model, dataset, day)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_evaluation_rollups_day ON evaluation_rollups (day)",
+    ]),
+    Migration(7, "re-scored evaluations", [
+        add_column("evaluations", "parent_evaluation_id", "INTEGER REFERENCES evaluations(id) ON DELETE SET NULL"),
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_parent_evaluation_id ON evaluations (parent_evaluation_id)",
+    ]),
+    Migration(8, "per-evaluator scores", [
+        add_column("evaluations", "scores", "TEXT"),
+        add_column("evaluation_details", "scores", "TEXT"),
+        # 롤업 도입 전 이력은 롤업이 읽는 컬럼(scores)이 모두 생긴 뒤 여기서 한 번만 채운다.
+        _rebuild_evaluation_rollups,
+    ]),
+    Migration(9, "retriever rerank cache", [
+        '''
+        CREATE TABLE IF NOT EXISTS rerank_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_rerank_cache_last_accessed ON rerank_cache (last_accessed)",
+        "CREATE INDEX IF NOT EXISTS idx_rerank_cache_created_at ON rerank_cache (created_at)",
+    ]),
+    Migration(10, "document ingestion state", [
+        '''
+        CREATE TABLE IF NOT EXISTS ingested_files (
+            collection TEXT NOT NULL,
+            source TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            chunks INTEGER NOT NULL,
+            ingested_at REAL NOT NULL,
+            PRIMARY KEY (collection, source)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ingested_chunks (
+            collection TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            source TEXT NOT NULL,
+            ingested_at REAL NOT NULL,
+            PRIMARY KEY (collection, chunk_id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_ingested_chunks_source ON ingested_chunks (collection, source)",
+    ]),
+    Migration(11, "streaming latency metrics", [
+        add_column("evaluations", "ttft", "TEXT"),
+        add_column("evaluations", "tokens_per_second", "TEXT"),
+        add_column("evaluation_details", "ttft", "REAL"),
+        add_column("evaluation_details", "tokens_per_second", "REAL"),
+        add_column("evaluation_details", "itl_p50", "REAL"),
+        add_column("evaluation_details", "itl_p99", "REAL"),
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: List[Migration] = None) -> int:
+    """ 아직 적용되지 않은 마이그레이션을 버전 순서대로 하나씩 트랜잭션으로 적용하고, 최종 버전을 반환한다. """
+    current_version = get_schema_version(conn)
+    for migration in sorted(migrations or MIGRATIONS, key=lambda m: m.version):
+        if migration.version <= current_version:
+            continue
+
+        cursor = conn.cursor()
+        # DDL 도 같은 트랜잭션에 묶이도록 명시적으로 시작한다.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # 다른 프로세스가 먼저 마이그레이션을 끝냈을 수 있으므로 잠금을 잡은 뒤 다시 확인
+            if get_schema_version(conn) >= migration.version:
+                conn.commit()
+                continue
+            migration.apply(cursor)
+            cursor.execute(f"PRAGMA user_version = {migration.version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current_version = migration.version
+
+    return current_version
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
+    import time
+
+    # 인덱스 적용 전(버전 2)과 후(최신)의 조회 지연 시간을 evaluation_details 행 수별로 비교
+    # 사용법: python -m libs.util.migration [행 수 ...]
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    rows_per_evaluation = 1_000
+
+    # 마이그레이션 도입 전 스키마(status 컬럼 없음)로 저장된 평가가 최신 버전의 추이와 요약에 포함되는지 확인
+    from libs.evaluation.evaluation_history import EvaluationHistory
+    from libs.evaluation.rollup import EvaluationRollup
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_database = os.path.join(tmp_dir, "legacy.db")
+        conn = sqlite3.connect(legacy_database)
+        MIGRATIONS[0].apply(conn.cursor())
+        conn.execute(
+            "INSERT INTO evaluations (evaluation_type, metadata, token_usage, latency, score) VALUES ('ExactMatchEvaluator', ?, ?, ?, 1)",
+            (str({"model": "gpt-4o-mini", "prompt": "legacy", "prompt_version_id": 1, "dataset": "legacy"}),
+             str({"total_tokens": 30}), str({"50%": 0.5, "99%": 0.9}))
+        )
+        conn.execute(
+            "INSERT INTO evaluation_details (evaluation_id, input_variables, OUTPUT, input_token, output_token, latency, score) "
+            "VALUES (1, '{}', 'output', 10, 20, 0.5, 1)"
+        )
+        conn.commit()
+        migrate(conn)
+        conn.close()
+
+        trends = EvaluationRollup(legacy_database).get_trends()
+        summary = EvaluationHistory(legacy_database).summarize(["model"])
+        assert trends and trends[0]["evaluations"] == 1, f"Legacy evaluations are missing from trends: {trends}"
+        assert summary and summary[0]["evaluations"] == 1, f"Legacy evaluations are missing from summary: {summary}"
+        print(f"legacy evaluations after migration: trends={len(trends)}, summary={summary[0]['evaluations']}")
+
+    def measure(conn: sqlite3.Connection, query: str, params: tuple, repeat: int = 20) -> float:
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(query, params).fetchall()
+        return (time.perf_counter() - start_time) / repeat * 1000
+
+    queries = {
+        "evaluation details": ("SELECT * FROM evaluation_details WHERE evaluation_id = ?", lambda n: (n // rows_per_evaluation // 2,)),
+        "dataset entries": ("SELECT id, input_variables FROM data WHERE dataset_id = ? ORDER BY id LIMIT 100", lambda n: (n // rows_per_evaluation // 2,)),
+        "last prompt version": ("SELECT MAX(version_id) FROM prompt_versions WHERE prompt_id = ?", lambda n: (n // 20 // 2,)),
+    }
+
+    print(f"{'rows':>10} | {'query':<20} | {'before (ms)':>12} | {'after (ms)':>12}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conn = sqlite3.connect(os.path.join(tmp_dir, "benchmark.db"))
+            migrate(conn, [m for m in MIGRATIONS if m.version <= 2])
+
+            num_evaluations = max(1, size // rows_per_evaluation)
+            conn.executemany(
+                "INSERT INTO evaluations (id, evaluation_type, token_usage, latency, score) VALUES (?, 'ExactMatchEvaluator', '{}', '{}', 0)",
+                [(i,) for i in range(num_evaluations)]
+            )
+            conn.executemany(
+                "INSERT INTO evaluation_details (evaluation_id, entry_index, input_variables, OUTPUT, score) VALUES (?, ?, '{}', 'output', 1)",
+                ((i // rows_per_evaluation, i % rows_per_evaluation) for i in range(size))
+            )
+            conn.executemany(
+                "INSERT INTO data (dataset_id, input_variables) VALUES (?, '{}')",
+                ((i // rows_per_evaluation,) for i in range(size))
+            )
+            conn.executemany(
+                "INSERT INTO prompt_versions (prompt_id, version_id) VALUES (?, ?)",
+                ((i // 20, i % 20) for i in range(size // 10))
+            )
+            conn.commit()
+
+            before = {name: measure(conn, query, params(size)) for name, (query, params) in queries.items()}
+            migrate(conn)
+            after = {name: measure(conn, query, params(size)) for name, (query, params) in queries.items()}
+            conn.close()
+
+        for name in queries:
+            print(f"{size:>10,} | {name:<20} | {before[name]:>12.3f} | {after[name]:>12.3f}")
@@ -1,5 +1,6 @@
 import os
 
 DEFAULT_DATABASE_PATH = os.path.dirname(os.path.dirname(__file__)) + "/../llmops.db"
+DEFAULT_TRACE_DIR = os.path.dirname(os.path.dirname(__file__)) + "/../traces"
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
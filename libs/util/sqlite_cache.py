@@ -0,0 +1,86 @@
+import sqlite3
+import time
+from typing import Any, List, Optional, Tuple
+
+from libs.util.database import get_connection
+from libs.util.secret import DEFAULT_DATABASE_PATH
+
+
+class SQLiteCache:
+    """ cache_key 로 값을 저장하는 SQLite 캐시. 만료 시간이 지난 항목과 최대 개수를 넘는 항목(가장 오래 사용되지 않은 순)을 지운다.
+
+    하위 클래스는 table(cache_key, 값 컬럼, created_at, last_accessed 컬럼을 가진 테이블)과 value_columns 를 정하고,
+    값을 value_columns 순서의 행으로 바꿔 _put 으로 저장하는 set 과 행을 값으로 되돌리는 _decode 를 구현한다.
+    """
+    table: str
+    value_columns: List[str]
+
+    def __init__(self,
+                 database: str = DEFAULT_DATABASE_PATH,
+                 max_entries: int = 100_000,
+                 max_age_seconds: Optional[float] = 7 * 24 * 60 * 60,
+                 evict_interval: int = 100):
+        self.database = database
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.evict_interval = evict_interval
+
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+
+        self.evict()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return get_connection(self.database)
+
+    def _decode(self, row: Tuple) -> Any:
+        raise NotImplementedError
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT {', '.join(self.value_columns)}, created_at FROM {self.table} WHERE cache_key = ?", (cache_key,))
+        row = cursor.fetchone()
+        now = time.time()
+        if not row or (self.max_age_seconds is not None and now - row[-1] > self.max_age_seconds):
+            self.misses += 1
+            return None
+
+        cursor.execute(f"UPDATE {self.table} SET last_accessed = ? WHERE cache_key = ?", (now, cache_key))
+        self.conn.commit()
+        self.hits += 1
+        return self._decode(row[:-1])
+
+    def _put(self, cache_key: str, values: Tuple):
+        now = time.time()
+        columns = ["cache_key"] + self.value_columns + ["created_at", "last_accessed"]
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            (cache_key, *values, now, now)
+        )
+        self.conn.commit()
+
+        self._writes_since_evict += 1
+        if self._writes_since_evict >= self.evict_interval:
+            self.evict()
+
+    def evict(self):
+        """ 오래된 항목을 지우고, 최대 개수를 넘는 항목은 가장 오래 사용되지 않은 순서로 지운다. """
+        cursor = self.conn.cursor()
+        if self.max_age_seconds is not None:
+            cursor.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+        if self.max_entries is not None:
+            cursor.execute(f'''
+                DELETE FROM {self.table} WHERE cache_key IN (
+                    SELECT cache_key FROM {self.table} ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+        self.conn.commit()
+        self._writes_since_evict = 0
+
+    def clear(self):
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM {self.table}")
+        self.conn.commit()
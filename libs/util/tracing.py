@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+# 부모 span 의 값을 자식 span 이 그대로 물려받는 속성
+INHERITED_ATTRIBUTES = ["entry_index"]
+
+
+class Span:
+    """ 이름, 시작/종료 시각, 속성을 갖는 구간. with 문으로 쓰면 안에서 만든 span 의 부모가 된다. """
+    __slots__ = ("tracer", "name", "span_id", "parent_id", "attributes", "lane", "start", "end", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        if parent is not None:
+            for key in INHERITED_ATTRIBUTES:
+                if key in parent.attributes and key not in attributes:
+                    attributes[key] = parent.attributes[key]
+        self.attributes = attributes
+        self.lane = _current_lane()
+        self.start = time.perf_counter()
+        self.end = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end = time.perf_counter()
+        if error is not None:
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        self.tracer._record(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _current_span.reset(self._token)
+        self.finish(exc_value)
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> bool:
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+class _NoopSpan:
+    """ 트레이싱이 꺼져 있을 때 span() 이 돌려주는 객체. 아무것도 기록하지 않는다. """
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+    async def __aenter__(self) -> "_NoopSpan":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_tracer: ContextVar[Optional["Tracer"]] = ContextVar("llmops_tracer", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("llmops_span", default=None)
+# 값이 있으면 LangChain 이 모든 실행의 callbacks 에 이 핸들러를 추가한다. (체인 호출마다 config 를 넘기지 않아도 됨)
+_callback_handler: ContextVar[Optional["TracingCallbackHandler"]] = ContextVar("llmops_tracing_callback", default=None)
+register_configure_hook(_callback_handler, inheritable=True)
+
+
+def span(name: str, **attributes) -> Any:
+    """ 현재 트레이서에 span 을 만든다. 트레이싱이 꺼져 있으면 contextvar 하나만 확인하고 no-op 객체를 반환한다. """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return _NOOP_SPAN
+    return Span(tracer, name, _current_span.get(), attributes)
+
+
+def _current_lane() -> Any:
+    """ 같은 asyncio task(없으면 스레드) 안의 span 은 순서대로 중첩되므로 trace viewer 의 한 줄에 표시한다. """
+    try:
+        asyncio.get_running_loop()
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return ("task", id(task)) if task is not None else ("thread", threading.get_ident())
+
+
+class Tracer:
+    """ 한 번의 평가 실행에서 끝난 span 을 메모리에 모아 두고 JSONL / Chrome trace(Perfetto) 파일로 내보낸다.
+
+    activate() 안에서 실행한 코드의 span() 과 LangChain 호출(prompt, chat model, retriever)이 기록된다.
+    """
+
+    def __init__(self, trace_id: Any = None):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # perf_counter 값을 epoch 초로 바꾸기 위한 기준
+        self._epoch_offset = time.time() - time.perf_counter()
+
+    @contextmanager
+    def activate(self) -> Iterator["Tracer"]:
+        tracer_token = _current_tracer.set(self)
+        handler_token = _callback_handler.set(TracingCallbackHandler(self))
+        try:
+            yield self
+        finally:
+            _callback_handler.reset(handler_token)
+            _current_tracer.reset(tracer_token)
+
+    def _record(self, finished: Span):
+        with self._lock:
+            self.spans.append(finished)
+
+    def stage_breakdown(self) -> Dict[str, Dict[str, float]]:
+        """ span 이름별 호출 수와 소요 시간. 중첩/동시 실행된 span 은 각각 더하므로 합계가 전체 시간보다 클 수 있다. """
+        stages: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            duration = s.end - s.start
+            stage = stages.setdefault(s.name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stage["count"] += 1
+            stage["total_seconds"] += duration
+            stage["max_seconds"] = max(stage["max_seconds"], duration)
+        for stage in stages.values():
+            stage["mean_seconds"] = stage["total_seconds"] / stage["count"]
+        return dict(sorted(stages.items(), key=lambda item: item[1]["total_seconds"], reverse=True))
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [{
+            "trace_id": self.trace_id,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "name": s.name,
+            "start": s.start + self._epoch_offset,
+            "duration": s.end - s.start,
+            "attributes": s.attributes,
+        } for s in spans]
+
+    def export_jsonl(self, path: str) -> str:
+        """ span 을 한 줄에 하나씩 추가한다. (재개한 실행의 span 은 같은 파일 뒤에 이어서 기록) """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for record in self.to_records():
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        return path
+
+    def export_chrome_trace(self, path: str) -> str:
+        """ chrome://tracing, ui.perfetto.dev 에서 열 수 있는 Trace Event Format 파일 """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        origin = spans[0].start if spans else 0.0
+        pid = os.getpid()
+        lanes: Dict[Any, int] = {}
+        events = []
+        for s in spans:
+            if s.lane not in lanes:
+                lanes[s.lane] = len(lanes) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": lanes[s.lane],
+                               "args": {"name": f"{s.lane[0]} {lanes[s.lane]}"}})
+            events.append({
+                "name": s.name,
+                "cat": s.name.split(".")[0].split(":")[0],
+                "ph": "X",
+                "ts": (s.start - origin) * 1e6,
+                "dur": (s.end - s.start) * 1e6,
+                "pid": pid,
+                "tid": lanes[s.lane],
+                "args": dict(s.attributes, span_id=s.span_id, parent_id=s.parent_id),
+            })
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}},
+                               ensure_ascii=False, default=str))
+        return path
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """ LangChain 실행 중 prompt 렌더링, chat model 호출, retriever 검색을 span 으로 기록한다.
+
+    시작 시점의 현재 span 을 부모로 삼는다. 콜백은 시작과 끝이 다른 호출이므로 현재 span 은 바꾸지 않는다.
+    """
+    # 비동기 실행에서도 같은 task 에서 바로 실행해야 현재 span(contextvar)을 읽을 수 있다.
+    run_inline = True
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._runs: Dict[UUID, Span] = {}
+
+    def _start(self, run_id: UUID, name: str, **attributes):
+        self._runs[run_id] = Span(self.tracer, name, _current_span.get(), attributes)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes):
+        s = self._runs.pop(run_id, None)
+        if s is not None:
+            s.attributes.update(attributes)
+            s.finish(error)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> Any:
+        # 체인 단계 중 prompt 렌더링만 기록한다. (RunnableSequence 등은 생성/채점 span 과 겹침)
+        if kwargs.get("run_type") == "prompt":
+            self._start(run_id, "prompt", template=kwargs.get("name"))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> Any:
+        metadata = kwargs.get("metadata") or {}
+        model = metadata.get("ls_model_name") or kwargs.get("name") or "unknown"
+        self._start(run_id, f"llm:{model}", provider=metadata.get("ls_provider"))
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> Any:
+        metadata = kwargs.get("metadata") or {}
+        self._start(run_id, f"llm:{metadata.get('ls_model_name') or kwargs.get('name') or 'unknown'}")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage_metadata:
+                    usage = {"input_tokens": usage_metadata.get("input_tokens"), "output_tokens": usage_metadata.get("output_tokens")}
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._start(run_id, "retriever", retriever=kwargs.get("name"))
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._end(run_id, error)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    # 트레이싱이 꺼져 있을 때와 켜져 있을 때 span 하나의 비용
+    n = 200_000
+    start_time = time.perf_counter()
+    for _ in range(n):
+        with span("noop", entry_index=0):
+            pass
+    disabled = (time.perf_counter() - start_time) / n
+
+    tracer = Tracer(trace_id="benchmark")
+    with tracer.activate():
+        start_time = time.perf_counter()
+        for i in range(n):
+            with span("entry", entry_index=i):
+                pass
+        enabled = (time.perf_counter() - start_time) / n
+    print(f"span overhead | disabled {disabled * 1e9:,.0f}ns | enabled {enabled * 1e9:,.0f}ns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start_time = time.perf_counter()
+        tracer.export_chrome_trace(os.path.join(tmp, "trace.json"))
+        tracer.export_jsonl(os.path.join(tmp, "trace.jsonl"))
+        print(f"export {n:,} spans | {time.perf_counter() - start_time:.2f}s")
@@ -16,6 +16,7 @@ setup(
         "langchain-pinecone==0.2.2",
         "ollama==0.4.2",
         "pinecone==5.4.2",
+        "pypdf==5.1.0",
         "ragas==0.2.13",
         "streamlit==1.43.2",
         "streamlit-aggrid==1.1.1"
@@ -21,8 +21,16 @@ def manage_datasets():
 
         if st.session_state.selected_dataset:
             dataset = DATASET_STORAGE.get_dataset(st.session_state.selected_dataset)
-            entries = dataset.get_entries()
+            total_entries = dataset.count_entries()
+
+            page_size_col, page_col = st.columns(2)
+            page_size = page_size_col.selectbox("페이지 크기", [50, 100, 500, 1000], key="page_size")
+            total_pages = max(1, (total_entries + page_size - 1) // page_size)
+            page = page_col.number_input("페이지", min_value=1, max_value=total_pages, value=1, key="page")
+
+            entries = dataset.get_entries_page(limit=page_size, offset=(page - 1) * page_size)
             st.dataframe(entries, use_container_width=True)
+            st.caption(f"{total_entries} entries / {page} of {total_pages} pages")
 
             with st.expander("Add Entry Form"):
                 with st.container():
@@ -4,12 +4,14 @@ import streamlit as st
 from libs.dataset import DatasetStorage
 from libs.evaluation import Evaluation
 from libs.evaluator import EvaluatorType
-from libs.model import ChatModelManager
+from libs.model import ChatModelManager, ResponseCache
 from libs.prompt import Prompt
 from libs.prompt import PromptHub
+from libs.util.secret import DEFAULT_TRACE_DIR
 
 PROMPT_HUB = PromptHub()
 DATASET_STORAGE = DatasetStorage()
+DATASET_PREVIEW_SIZE = 100
 
 
 def init():
@@ -27,8 +29,6 @@ def init():
         st.session_state.dataset_list = DATASET_STORAGE.list_datasets()
     if "dataset" not in st.session_state:
         st.session_state.dataset = None
-    if "dataset_entries" not in st.session_state:
-        st.session_state.dataset_entries = None
     if "prompt_template" not in st.session_state:
         st.session_state.prompt_template = None
     if "system_prompt" not in st.session_state:
@@ -47,10 +47,15 @@ def update_prompt():
 
 
 def update_dataset():
-    dataset = DATASET_STORAGE.get_dataset(st.session_state.selected_dataset)
-    dataset_entries = dataset.get_entries()
-    st.session_state.dataset = dataset
-    st.session_state.dataset_entries = dataset_entries
+    # 엔트리는 평가를 시작할 때 iter_entries 로 읽고, 화면에는 앞부분만 보여준다.
+    st.session_state.dataset = DATASET_STORAGE.get_dataset(st.session_state.selected_dataset)
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}분 {seconds}초" if minutes else f"{seconds}초"
 
 
 def update_model():
@@ -83,17 +88,29 @@ def evaluate_model():
     st.selectbox("데이터셋 선택", st.session_state.dataset_list, index=None, key="selected_dataset", on_change=update_dataset)
     with st.expander(label="데이터셋"):
         if st.session_state.dataset:
-            st.dataframe(st.session_state.dataset_entries, use_container_width=True)
+            st.dataframe(st.session_state.dataset.get_entries_page(limit=DATASET_PREVIEW_SIZE), use_container_width=True)
+            st.caption(f"{st.session_state.dataset.count_entries()} entries")
 
-    st.selectbox("평가자 선택", st.session_state.evaluator_types, key="selected_evaluator")
-    if st.session_state.selected_evaluator == EvaluatorType.EMBEDDING_DISTANCE.value:
+    # 여러 평가자를 고르면 출력은 한 번만 생성하고 모든 평가자가 채점한다. (대표 점수는 첫 번째 평가자)
+    st.multiselect("평가자 선택", st.session_state.evaluator_types, default=st.session_state.evaluator_types[:1], key="selected_evaluators")
+    if EvaluatorType.EMBEDDING_DISTANCE.value in st.session_state.selected_evaluators:
         st.text_input("PINECONE_API_KEY", key="PINECONE_API_KEY")
+    st.number_input("Max Concurrency", min_value=1, value=1, key="max_concurrency")
+    if EvaluatorType.LLM_JUDGE.value in st.session_state.selected_evaluators:
+        st.number_input("Judge Concurrency", min_value=1, value=1, key="judge_concurrency")
+        st.number_input("Judge Pack Size", min_value=1, value=1, key="judge_pack_size")
+    st.checkbox("스트리밍으로 TTFT / 초당 토큰 수 측정", value=False, key="measure_streaming")
+    st.checkbox("단계별 트레이스 기록", value=False, key="record_trace")
+    st.number_input("이어서 실행할 평가 ID (0 이면 새 평가)", min_value=0, value=0, key="resume_evaluation_id")
+    st.checkbox("응답 캐시 사용", value=False, key="use_response_cache")
+    if st.session_state.use_response_cache:
+        st.checkbox("캐시 무시하고 새로 생성 (bypass)", value=False, key="bypass_response_cache")
 
     if st.button("Run Evaluation") \
             and st.session_state.selected_prompt \
             and st.session_state.selected_model \
             and st.session_state.selected_dataset \
-            and st.session_state.selected_evaluator:
+            and st.session_state.selected_evaluators:
 
         require_args = {k: st.session_state.get(k) for k in st.session_state.model_args.keys()}
         model = st.session_state.get("cmm").get_model(
@@ -108,10 +125,32 @@ def evaluate_model():
         if "PINECONE_API_KEY" in st.session_state:
             environment["PINECONE_API_KEY"] = st.session_state.PINECONE_API_KEY
 
+        response_cache = None
+        if st.session_state.use_response_cache:
+            response_cache = ResponseCache(bypass=st.session_state.get("bypass_response_cache", False))
+
+        progress_bar = st.progress(0.0, text="Evaluation...")
+        progress_metrics = st.empty()
+
+        def show_progress(snapshot):
+            progress_bar.progress(
+                snapshot["progress"],
+                text=f"{snapshot['completed']}/{snapshot['total']} · 경과 {format_seconds(snapshot['elapsed_seconds'])} · 남은 시간 {format_seconds(snapshot['eta_seconds'])}"
+            )
+            with progress_metrics.container():
+                score_column, latency_column, token_column = st.columns(3)
+                score_column.metric("score", f"{snapshot['score']:.4f}")
+                latency_column.metric("latency p50 / p99", f"{snapshot['latency']['50%']:.2f}s / {snapshot['latency']['99%']:.2f}s")
+                token_column.metric("token p50 / p99", f"{snapshot['token_usage']['50%']:.0f} / {snapshot['token_usage']['99%']:.0f}")
+                if snapshot["ttft"]:
+                    ttft_column, throughput_column, _ = st.columns(3)
+                    ttft_column.metric("TTFT p50 / p99", f"{snapshot['ttft']['50%']:.2f}s / {snapshot['ttft']['99%']:.2f}s")
+                    throughput_column.metric("tokens/s p50", f"{snapshot['tokens_per_second']['50%']:.1f}" if snapshot["tokens_per_second"] else "-")
+
         evaluation = Evaluation(
             chain=chain,
-            evaluation_type=EvaluatorType(st.session_state.selected_evaluator),
-            dataset_entries=[(d["input_variables"], d["reference_output"]) for d in st.session_state.dataset_entries],
+            evaluation_type=[EvaluatorType(evaluator) for evaluator in st.session_state.selected_evaluators],
+            dataset_entries=[(d["input_variables"], d["reference_output"]) for d in st.session_state.dataset.iter_entries()],
             metadata={
                 "prompt": st.session_state.selected_prompt,
                 "prompt_version_id": st.session_state.selected_prompt_version,
@@ -119,10 +158,18 @@ def evaluate_model():
                 "dataset": st.session_state.selected_dataset
             },
             environment=environment,
+            max_concurrency=st.session_state.max_concurrency,
+            response_cache=response_cache,
+            judge_concurrency=st.session_state.get("judge_concurrency"),
+            judge_pack_size=st.session_state.get("judge_pack_size", 1),
+            measure_streaming=st.session_state.measure_streaming,
+            trace_dir=DEFAULT_TRACE_DIR if st.session_state.record_trace else None,
+            progress_callback=show_progress,
         )
 
         with st.status("Evaluation..."):
-            results = evaluation.run_evaluation()
+            results = evaluation.run_evaluation(resume_evaluation_id=st.session_state.resume_evaluation_id or None)
+            st.caption(f"evaluation_id: {evaluation.evaluation_id}")
             token_usage = evaluation.token_usage
             latency = evaluation.latency
             score = evaluation.score
@@ -133,8 +180,21 @@ def evaluate_model():
             st.caption("latency:")
             st.dataframe(pd.json_normalize(latency), hide_index=True)
 
+            if evaluation.ttft:
+                st.caption("ttft:")
+                st.dataframe(pd.json_normalize(evaluation.ttft), hide_index=True)
+            if evaluation.tokens_per_second:
+                st.caption("tokens_per_second:")
+                st.dataframe(pd.json_normalize(evaluation.tokens_per_second), hide_index=True)
+
+            if evaluation.tracer is not None:
+                st.caption(f"trace: {evaluation.metadata['trace']['chrome']}")
+
             st.caption("score:")
             st.write(score)
+            if evaluation.scores:
+                st.caption("scores:")
+                st.dataframe(pd.json_normalize(evaluation.scores), hide_index=True)
 
             st.dataframe(pd.DataFrame(results), )
 
@@ -1,11 +1,17 @@
-import json
-import sqlite3
-
 import pandas as pd
 import streamlit as st
 from st_aggrid import AgGrid, GridOptionsBuilder
 
-from libs.util.secret import DEFAULT_DATABASE_PATH
+from libs.dataset import DatasetStorage
+from libs.evaluation import Evaluation, EvaluationHistory
+from libs.evaluation.evaluation import EvaluationStatus
+from libs.evaluator import EvaluatorType
+from libs.model import ChatModelManager
+from libs.prompt import PromptHub
+
+EVALUATION_HISTORY = EvaluationHistory()
+PROMPT_HUB = PromptHub()
+DATASET_STORAGE = DatasetStorage()
 
 
 def aggrid_interactive_table(df: pd.DataFrame) -> AgGrid:
@@ -24,54 +30,145 @@ def aggrid_interactive_table(df: pd.DataFrame) -> AgGrid:
     return selection
 
 
-def load_evaluation_history():
-    conn = sqlite3.connect(DEFAULT_DATABASE_PATH)
-    query = "SELECT * FROM evaluations"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-
-def load_evaluation_details(evaluation_id):
-    conn = sqlite3.connect(DEFAULT_DATABASE_PATH)
-    query = "SELECT * FROM evaluation_details WHERE evaluation_id = ?"
-    df = pd.read_sql_query(query, conn, params=(evaluation_id,))
-    conn.close()
-    return df
+def history_filters():
+    with st.expander("필터 / 정렬"):
+        prompt_col, model_col, dataset_col = st.columns(3)
+        prompt = prompt_col.selectbox("프롬프트", PROMPT_HUB.get_prompt_list(), index=None)
+        model = model_col.selectbox("모델", ChatModelManager().get_model_list(), index=None)
+        dataset = dataset_col.selectbox("데이터셋", DATASET_STORAGE.list_datasets(), index=None)
+
+        type_col, status_col = st.columns(2)
+        evaluation_type = type_col.selectbox("평가자", [t.value for t in EvaluatorType], index=None)
+        status = status_col.selectbox("상태", [s.value for s in EvaluationStatus], index=None)
+
+        start_col, end_col = st.columns(2)
+        start_date = start_col.date_input("시작일", value=None)
+        end_date = end_col.date_input("종료일", value=None)
+
+        min_score, max_score = st.slider("점수 범위", 0.0, 1.0, (0.0, 1.0))
+
+        sort_col, order_col = st.columns(2)
+        sort_by = sort_col.selectbox("정렬 기준", ["id", "TIMESTAMP", "score", "latency_p50", "latency_p99", "evaluation_type", "status"])
+        descending = order_col.radio("정렬 순서", ["내림차순", "오름차순"], horizontal=True) == "내림차순"
+
+    filters = {
+        "prompt": prompt,
+        "model": model,
+        "dataset": dataset,
+        "evaluation_type": evaluation_type,
+        "status": status,
+        "start_date": start_date,
+        "end_date": end_date,
+        # 기본 범위(0~1) 에서는 점수 필터를 걸지 않는다. (범위 밖 점수를 쓰는 평가자 대비)
+        "min_score": min_score if min_score > 0.0 else None,
+        "max_score": max_score if max_score < 1.0 else None,
+    }
+    return filters, sort_by, descending
+
+
+def pagination(total: int, key: str, page_sizes=(20, 50, 100)):
+    page_size_col, page_col = st.columns(2)
+    page_size = page_size_col.selectbox("페이지 크기", page_sizes, key=f"{key}_page_size")
+    total_pages = max(1, (total + page_size - 1) // page_size)
+    page = page_col.number_input("페이지", min_value=1, max_value=total_pages, value=1, key=f"{key}_page")
+    st.caption(f"{total} rows / {page} of {total_pages} pages")
+    return page_size, (page - 1) * page_size
+
+
+def show_evaluation(evaluation_id: int):
+    evaluation = EVALUATION_HISTORY.get_evaluation(evaluation_id)
+    if evaluation is None:
+        return
+
+    # 선택한 평가에 대한 요약 정보 출력
+    st.divider()
+    for key, value in evaluation.items():
+        if key in ["metadata", "latency", "token_usage", "ttft", "tokens_per_second"]:
+            st.caption(f"{key}:")
+            st.json(value, expanded=False)
+        else:
+            st.caption(f"{key}: `{value}`")
+    show_stage_breakdown((evaluation.get("metadata") or {}).get("trace"))
+    st.divider()
+
+    # 선택한 평가의 상세 데이터 엔트리 정보 출력 (선택한 페이지만 조회)
+    limit, offset = pagination(EVALUATION_HISTORY.count_details(evaluation_id), key="details", page_sizes=(50, 100, 500))
+    details = EVALUATION_HISTORY.get_details(evaluation_id, limit=limit, offset=offset)
+    st.dataframe(pd.DataFrame(details), use_container_width=True, hide_index=True)
+
+    rescore_evaluation(evaluation_id)
+
+
+def show_stage_breakdown(trace: dict):
+    """ 트레이스를 기록한 평가의 단계별 소요 시간 (동시 실행/중첩된 구간은 각각 더해짐) """
+    if not trace or not trace.get("stages"):
+        return
+    st.caption("stage breakdown:")
+    stages = pd.DataFrame.from_dict(trace["stages"], orient="index")
+    stages.index.name = "stage"
+    st.bar_chart(stages["total_seconds"], horizontal=True)
+    st.dataframe(stages, use_container_width=True)
+    st.caption(f"trace files: `{trace.get('jsonl')}`, `{trace.get('chrome')}` (ui.perfetto.dev 에서 열기)")
+
+
+def rescore_evaluation(evaluation_id: int):
+    """ 저장된 출력을 다른 평가자로 다시 채점한다. (체인은 다시 호출하지 않음) """
+    with st.expander("다른 평가자로 재채점"):
+        evaluator_types = st.multiselect("평가자 선택", [t.value for t in EvaluatorType], key="rescore_evaluator_types")
+        environment = {}
+        if EvaluatorType.EMBEDDING_DISTANCE.value in evaluator_types:
+            environment["PINECONE_API_KEY"] = st.text_input("PINECONE_API_KEY", key="rescore_pinecone_api_key")
+        judge_concurrency, judge_pack_size = 1, 1
+        if EvaluatorType.LLM_JUDGE.value in evaluator_types:
+            judge_concurrency = st.number_input("Judge Concurrency", min_value=1, value=1, key="rescore_judge_concurrency")
+            judge_pack_size = st.number_input("Judge Pack Size", min_value=1, value=1, key="rescore_judge_pack_size")
+
+        if st.button("Re-score") and evaluator_types:
+            progress_bar = st.progress(0.0, text="Re-scoring...")
+            evaluations = Evaluation.rescore(
+                evaluation_id,
+                [EvaluatorType(evaluator_type) for evaluator_type in evaluator_types],
+                environment=environment,
+                judge_concurrency=judge_concurrency,
+                judge_pack_size=judge_pack_size,
+                progress_callback=lambda snapshot: progress_bar.progress(
+                    snapshot["progress"], text=f"{snapshot['completed']}/{snapshot['total']}"
+                ),
+            )
+            st.dataframe(pd.DataFrame([
+                {"evaluation_id": evaluation.evaluation_id, "evaluation_type": evaluation.evaluation_type.value, "score": evaluation.score}
+                for evaluation in evaluations
+            ]), hide_index=True)
+            st.toast("재채점이 완료되었습니다!", icon="🎉")
 
 
 def evaluation_history():
     st.title("Evaluation History")
 
-    df = load_evaluation_history()
-    if df.empty:
+    filters, sort_by, descending = history_filters()
+    total = EVALUATION_HISTORY.count_evaluations(**filters)
+    if total == 0:
         st.write("No evaluation history found.")
-    else:
-        # 평가 결과 테이블 출력
-        selection = aggrid_interactive_table(df=df)
-
-        # 선택한 행에 대한 상세 정보 출력
-        if selection:
-            selected_rows = selection.get("selected_rows")
-            if isinstance(selected_rows, pd.DataFrame):
-                # 선택한 행을 JSON 으로 변환
-                selected_json_str = selected_rows.to_json(orient="records")
-                selected_json = json.loads(selected_json_str)[0]
-
-                # 선택한 평가에 대한 요약 정보 출력
-                st.divider()
-                for key, value in selected_json.items():
-                    if key in ["metadata", "latency", "token_usage"]:
-                        st.caption(f"{key}:")
-                        st.json(value, expanded=False)
-                    else:
-                        st.caption(f"{key}: `{value}`")
-                st.divider()
-
-                # 선택한 평가의 상세 데이터 엔트리 정보 출력
-                evaluation_id = selected_json["id"]
-                details_df = load_evaluation_details(evaluation_id)
-                st.dataframe(details_df, use_container_width=True, hide_index=True)
+        return
+
+    limit, offset = pagination(total, key="evaluations")
+    evaluations = EVALUATION_HISTORY.get_evaluations(
+        sort_by=sort_by,
+        descending=descending,
+        limit=limit,
+        offset=offset,
+        **filters
+    )
+    df = pd.DataFrame(evaluations)
+
+    # 평가 결과 테이블 출력
+    selection = aggrid_interactive_table(df=df)
+
+    # 선택한 행에 대한 상세 정보 출력
+    if selection:
+        selected_rows = selection.get("selected_rows")
+        if isinstance(selected_rows, pd.DataFrame) and not selected_rows.empty:
+            show_evaluation(int(selected_rows.iloc[0]["id"]))
 
 
 evaluation_history()
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import streamlit as st
+
+from libs.dataset import DatasetStorage
+from libs.evaluation import EvaluationRollup
+from libs.evaluator import EvaluatorType
+from libs.model import ChatModelManager
+from libs.prompt import PromptHub
+
+EVALUATION_ROLLUP = EvaluationRollup()
+PROMPT_HUB = PromptHub()
+DATASET_STORAGE = DatasetStorage()
+
+PERIOD_LABELS = {"일": "day", "주": "week", "월": "month"}
+GROUP_BY_LABELS = {"프롬프트 버전": ["prompt", "prompt_version_id"], "모델": ["model"], "데이터셋": ["dataset"]}
+METRICS = ["score", "latency_p50", "latency_p99", "token_usage_p50", "token_usage_p99", "evaluations", "entries"]
+
+
+def series_name(row, group_by):
+    return " / ".join(str(row[key]) for key in group_by)
+
+
+def trends():
+    st.title("Trends")
+
+    # 평가자마다 점수의 의미가 다르므로 평가자 하나를 골라서 본다.
+    evaluation_type = st.selectbox("평가자", [t.value for t in EvaluatorType])
+    prompt_col, model_col, dataset_col = st.columns(3)
+    prompt = prompt_col.selectbox("프롬프트", PROMPT_HUB.get_prompt_list(), index=None)
+    model = model_col.selectbox("모델", ChatModelManager().get_model_list(), index=None)
+    dataset = dataset_col.selectbox("데이터셋", DATASET_STORAGE.list_datasets(), index=None)
+
+    period_col, group_col, range_col = st.columns(3)
+    period = PERIOD_LABELS[period_col.radio("기간 단위", list(PERIOD_LABELS), horizontal=True)]
+    group_by = sum((GROUP_BY_LABELS[label] for label in group_col.multiselect("묶는 기준", list(GROUP_BY_LABELS), default=["모델"])), [])
+    date_range = range_col.date_input("조회 기간", value=(date.today() - timedelta(days=30), date.today()))
+
+    start_date, end_date = (date_range + (None,))[:2] if isinstance(date_range, tuple) else (date_range, None)
+    rows = EVALUATION_ROLLUP.get_trends(
+        period=period,
+        group_by=group_by,
+        start_date=start_date,
+        end_date=end_date,
+        evaluation_type=evaluation_type,
+        prompt=prompt,
+        model=model,
+        dataset=dataset,
+    )
+    if not rows:
+        st.write("No evaluation trends found.")
+        return
+
+    df = pd.DataFrame(rows)
+    df["series"] = [series_name(row, group_by) for row in rows] if group_by else "all"
+
+    for metric in st.multiselect("지표", METRICS, default=["score", "latency_p99", "token_usage_p50"]):
+        st.caption(metric)
+        st.line_chart(df.pivot_table(index=period, columns="series", values=metric))
+
+    with st.expander("데이터"):
+        st.dataframe(df.drop(columns=["series"]), use_container_width=True, hide_index=True)
+
+
+trends()